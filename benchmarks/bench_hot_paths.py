@@ -0,0 +1,226 @@
+"""
+Microbenchmarks for the pure-Python hot paths of the bot.
+
+Covers UserMemory.add_message, save/load_user_memory, get_relevant_context,
+get_time_aware_personality and the message chunker on synthetic users with
+different history sizes and scripts. Reports wall time and tracemalloc
+allocations per operation and writes JSON that can be compared across
+versions.
+
+Usage:
+    python benchmarks/bench_hot_paths.py --output results.json
+    python benchmarks/bench_hot_paths.py --sizes 10 10000 --scripts latin cjk
+    python benchmarks/bench_hot_paths.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from memory import UserMemory  # noqa: E402
+from message_utils import split_message_text  # noqa: E402
+from personality import get_time_aware_personality  # noqa: E402
+
+DEFAULT_SIZES = (10, 10_000, 200_000)
+
+# Word pools per script; messages are built from random words of one pool
+SCRIPTS = {
+    'latin': "merhaba nasılsın bugün hava güzel yarın çalışmak istiyorum hello world weather tomorrow".split(),
+    'cyrillic': "привет как дела сегодня погода хорошая завтра работа хочу знать".split(),
+    'cjk': "你好 今天 天气 很好 明天 工作 想要 知道 こんにちは 今日 天気 明日".split(),
+    'arabic': "مرحبا كيف حالك اليوم الطقس جميل غدا العمل أريد أن أعرف".split(),
+    'emoji': "merhaba 😀 🤖 🌈 nasılsın 🔥 ✨ güzel 🎉 hello 💬 🌟".split(),
+}
+
+
+def make_text(rng, words, min_words=5, max_words=60):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(min_words, max_words)))
+
+
+def make_user(memory, user_id, size, script, seed=0):
+    """Populate a user's history in memory without touching the disk"""
+    rng = random.Random(seed)
+    words = SCRIPTS[script]
+    memory.get_user_settings(user_id)
+    messages = memory.users[user_id]["messages"]
+    now = datetime.now()
+    for i in range(size):
+        messages.append("user" if i % 2 == 0 else "model", make_text(rng, words), now)
+    memory.users[user_id]["total_tokens"] = messages.total_tokens
+
+
+def measure(fn, setup=None, min_time=0.2, min_iterations=3, max_iterations=10_000):
+    """Time fn repeatedly, then run it once under tracemalloc"""
+    times = []
+    while (sum(times) < min_time or len(times) < min_iterations) and len(times) < max_iterations:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    fn()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": len(times),
+        "mean_s": statistics.fmean(times),
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "alloc_peak_bytes": peak - before,
+        "alloc_net_bytes": after - before,
+    }
+
+
+def bench_user(memory_dir, size, script, min_time):
+    """Benchmark the UserMemory operations for one synthetic user"""
+    results = []
+    memory = UserMemory(memory_dir=memory_dir)
+    user_id = f"bench_{script}_{size}"
+    make_user(memory, user_id, size, script)
+    memory.save_user_memory(user_id)
+    rng = random.Random(1)
+    words = SCRIPTS[script]
+
+    def add_message():
+        memory.add_message(user_id, "user", make_text(rng, words))
+
+    def evict():
+        memory.users.pop(user_id, None)
+
+    cases = [
+        ("add_message", add_message, None),
+        ("save_user_memory", lambda: memory.save_user_memory(user_id), None),
+        ("load_user_memory", lambda: memory.load_user_memory(user_id), evict),
+        ("get_relevant_context", lambda: memory.get_relevant_context(user_id), None),
+    ]
+    for name, fn, setup in cases:
+        stats = measure(fn, setup=setup, min_time=min_time)
+        results.append({"operation": name, "messages": size, "script": script, **stats})
+        report(results[-1])
+    return results
+
+
+def bench_personality(min_time):
+    now = datetime.now(timezone.utc)
+    stats = measure(
+        lambda: get_time_aware_personality(now, 'tr', 'Europe/Istanbul'),
+        min_time=min_time
+    )
+    result = {"operation": "get_time_aware_personality", "messages": 0, "script": "n/a", **stats}
+    report(result)
+    return [result]
+
+
+def bench_chunker(script, min_time):
+    results = []
+    rng = random.Random(2)
+    words = SCRIPTS[script]
+    for target_chars in (4_000, 64_000):
+        lines = []
+        total = 0
+        while total < target_chars:
+            line = make_text(rng, words, 3, 30)
+            lines.append(line)
+            total += len(line) + 1
+        text = '\n'.join(lines)
+        stats = measure(lambda: split_message_text(text), min_time=min_time)
+        results.append({
+            "operation": f"split_message_text_{target_chars // 1000}k",
+            "messages": 0,
+            "script": script,
+            **stats
+        })
+        report(results[-1])
+    return results
+
+
+def report(result):
+    print(
+        f"{result['operation']:<30} {result['script']:<9} {result['messages']:>8} msgs "
+        f"{result['mean_s'] * 1e6:>12.1f} µs/op  "
+        f"peak {result['alloc_peak_bytes'] / 1024:>10.1f} KiB  "
+        f"net {result['alloc_net_bytes'] / 1024:>10.1f} KiB  "
+        f"(n={result['iterations']})"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(old_path, new_path):
+    """Print per-operation time and allocation ratios between two result files"""
+    with open(old_path, encoding='utf-8') as f:
+        old = {(r["operation"], r["messages"], r["script"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding='utf-8') as f:
+        new = {(r["operation"], r["messages"], r["script"]): r for r in json.load(f)["results"]}
+
+    print(f"{'operation':<30} {'script':<9} {'msgs':>8} {'time new/old':>13} {'peak new/old':>13}")
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        time_ratio = n["mean_s"] / o["mean_s"] if o["mean_s"] else float('nan')
+        peak_ratio = n["alloc_peak_bytes"] / o["alloc_peak_bytes"] if o["alloc_peak_bytes"] else float('nan')
+        print(f"{key[0]:<30} {key[2]:<9} {key[1]:>8} {time_ratio:>12.2f}x {peak_ratio:>12.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--scripts", nargs="+", choices=sorted(SCRIPTS), default=sorted(SCRIPTS))
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds spent per case")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = bench_personality(args.min_time)
+    with tempfile.TemporaryDirectory() as memory_dir:
+        for script in args.scripts:
+            results.extend(bench_chunker(script, args.min_time))
+            for size in args.sizes:
+                results.extend(bench_user(memory_dir, size, script, args.min_time))
+
+    if args.output:
+        payload = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
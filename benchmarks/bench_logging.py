@@ -0,0 +1,100 @@
+"""
+Benchmark the logging overhead seen by a message handler.
+
+Compares the old synchronous FileHandler setup that dumped the full message
+object with the queue-based handler and structured, truncated fields.
+
+Usage:
+    python benchmarks/bench_logging.py [--iterations 20000]
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_config  # noqa: E402
+
+# Roughly the size of str(update.message) for a short text message
+FAKE_MESSAGE_REPR = "Message(" + ", ".join(f"field_{i}=value_{i}" for i in range(60)) + ")"
+FAKE_TEXT = "Merhaba Nyxie, bugün hava nasıl olacak? " * 4
+
+
+def reset_root():
+    log_config.stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def old_handler_path(logger):
+    logger.info("Entering handle_message function")
+    logger.info(f"Message received: {FAKE_MESSAGE_REPR}")
+    logger.info(f"Message text: {FAKE_TEXT}")
+    logger.info("User ID: 123456789")
+    logger.info(f"Processed message text: {FAKE_TEXT.strip()}")
+
+
+def new_handler_path(logger):
+    logger.debug("Entering handle_message function")
+    log_config.log_event(
+        logger, logging.INFO, "message_received", sampled=True,
+        user="123456789", chat=123456789, message_id=42,
+        length=len(FAKE_TEXT), text=log_config.truncate(FAKE_TEXT, 80)
+    )
+
+
+def run(label, setup, handler_path, iterations):
+    reset_root()
+    setup()
+    logger = logging.getLogger("bench")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        handler_path(logger)
+    elapsed = time.perf_counter() - start
+    reset_root()
+    per_call_us = elapsed / iterations * 1e6
+    print(f"{label:<40} {per_call_us:8.2f} µs/message")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        log_file = os.path.join(tmp, "bot_logs.log")
+
+        def sync_setup():
+            logging.basicConfig(
+                level=logging.INFO,
+                format=log_config.LOG_FORMAT,
+                handlers=[
+                    logging.FileHandler(log_file, encoding="utf-8"),
+                    logging.StreamHandler(devnull),
+                ],
+                force=True,
+            )
+
+        def queue_setup():
+            listener = log_config.setup_logging(log_file)
+            # Keep stdout quiet during the benchmark
+            for handler in listener.handlers:
+                if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+                    handler.setStream(devnull)
+
+        before = run("sync FileHandler + full dumps", sync_setup, old_handler_path, args.iterations)
+        queued = run("queue handler + full dumps", queue_setup, old_handler_path, args.iterations)
+        after = run("queue handler + structured fields", queue_setup, new_handler_path, args.iterations)
+
+    print(f"\nspeedup (handler path): {before / after:.1f}x, queue alone: {before / queued:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Disk savings and rehydration cost of the compressed cold tier.
+
+A synthetic corpus of users is written to a temporary memory directory in
+the hot format, then every user is archived. The report compares bytes on
+disk before and after, the time to archive, and per-user load latency from
+the hot tier against rehydration from the cold tier (which includes writing
+the hot file back). Message text is drawn from a Zipf-distributed
+pseudo-word vocabulary so it doesn't compress unrealistically well.
+
+Usage:
+    python benchmarks/bench_memory_archive.py [--users 500] [--codecs gzip zstd]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import memory  # noqa: E402
+from memory import UserMemory  # noqa: E402
+from message_log import MessageLog  # noqa: E402
+
+SYLLABLES = "ka le mi no ru sa te yo bi da fu ge hi ja ko lu ma ne pi ra si tu va ze".split()
+
+
+def make_vocabulary(rng, size=4000):
+    words = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(size * 2)})
+    rng.shuffle(words)
+    words = words[:size]
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+def make_corpus(memory_dir, users, seed=0):
+    rng = random.Random(seed)
+    words, weights = make_vocabulary(rng)
+    store = UserMemory(memory_dir)
+    for user_id in range(users):
+        # Most users have short histories, a few very long ones
+        size = min(5000, int(rng.lognormvariate(4.0, 1.2)) + 2)
+        log = MessageLog()
+        ts = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 300))
+        for i in range(size):
+            ts += timedelta(seconds=rng.randint(5, 3600))
+            text = ' '.join(rng.choices(words, weights, k=rng.randint(4, 80)))
+            log.append("user" if i % 2 == 0 else "model", text, ts, len(text.split()))
+        store.users[str(user_id)] = {
+            "messages": log,
+            "language": "tr",
+            "current_topic": None,
+            "total_tokens": log.total_tokens,
+            "preferences": {"custom_language": None, "timezone": "Europe/Istanbul"},
+        }
+        store.save_user_memory(user_id)
+    return users
+
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def time_loads(memory_dir, users, codec):
+    store = UserMemory(memory_dir, archive_codec=codec)
+    latencies = []
+    for user_id in range(users):
+        start = time.perf_counter()
+        store.load_user_memory(user_id)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def ms(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+
+def run(users, codec):
+    with tempfile.TemporaryDirectory() as memory_dir:
+        make_corpus(memory_dir, users)
+        hot_bytes = dir_bytes(memory_dir)
+        hot_loads = time_loads(memory_dir, users, codec)
+
+        store = UserMemory(memory_dir, archive_codec=codec)
+        start = time.perf_counter()
+        stats = store.archive_idle_users(-1)
+        archive_seconds = time.perf_counter() - start
+        assert stats["users"] == users, stats
+        cold_bytes = dir_bytes(memory_dir)
+
+        cold_loads = time_loads(memory_dir, users, codec)
+        assert dir_bytes(os.path.join(memory_dir, "archive")) == 0, "archives left after rehydration"
+    return {
+        "codec": codec,
+        "hot_bytes": hot_bytes,
+        "cold_bytes": cold_bytes,
+        "archive_ms_per_user": archive_seconds / users * 1000,
+        "hot_p50": ms(hot_loads, 50), "hot_p99": ms(hot_loads, 99),
+        "cold_p50": ms(cold_loads, 50), "cold_p99": ms(cold_loads, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--codecs", nargs="+", choices=["gzip", "zstd"], default=["gzip", "zstd"])
+    args = parser.parse_args()
+
+    print(f"{'codec':<6} {'hot MiB':>8} {'cold MiB':>9} {'saved':>6} {'archive ms/user':>16} "
+          f"{'hot load p50/p99 ms':>20} {'rehydrate p50/p99 ms':>21}")
+    for codec in args.codecs:
+        if codec == "zstd" and memory.zstandard is None:
+            print(f"{codec:<6} skipped: zstandard is not installed")
+            continue
+        r = run(args.users, codec)
+        print(f"{r['codec']:<6} {r['hot_bytes'] / 2**20:>8.1f} {r['cold_bytes'] / 2**20:>9.1f} "
+              f"{1 - r['cold_bytes'] / r['hot_bytes']:>6.0%} {r['archive_ms_per_user']:>16.2f} "
+              f"{r['hot_p50']:>9.2f} / {r['hot_p99']:<8.2f} {r['cold_p50']:>9.2f} / {r['cold_p99']:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
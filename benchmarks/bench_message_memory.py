@@ -0,0 +1,99 @@
+"""
+Bytes per stored message: JSON-style message dicts vs the columnar MessageLog.
+
+A synthetic history is serialized to the on-disk format, then loaded both
+ways under tracemalloc: as the plain list of dicts json.load produces (the
+previous in-memory form) and as a MessageLog. The content strings are the
+same size either way, so the per-message overhead without them is also
+reported. The MessageLog is checked to convert back to identical JSON.
+
+Usage:
+    python benchmarks/bench_message_memory.py [--sizes 1000 100000] [--scripts latin cjk]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_hot_paths import SCRIPTS, make_text  # noqa: E402
+from message_log import MessageLog  # noqa: E402
+
+
+def make_history(size, script, seed=0):
+    """On-disk JSON for a history with realistic, distinct timestamps"""
+    rng = random.Random(seed)
+    words = SCRIPTS[script]
+    ts = datetime(2024, 1, 1, 9, 0, 0)
+    messages = []
+    for i in range(size):
+        ts += timedelta(seconds=rng.randint(1, 600), microseconds=rng.randint(0, 999_999))
+        content = make_text(rng, words)
+        messages.append({
+            "role": "user" if i % 2 == 0 else "model",
+            "content": content,
+            "timestamp": ts.isoformat(),
+            "tokens": len(content.split()),
+        })
+    return json.dumps(messages, ensure_ascii=False)
+
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns, and the built object"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, obj
+
+
+def content_bytes(raw):
+    # Loaded once more so the strings are counted exactly as stored
+    size, _ = retained_bytes(lambda: [m["content"] for m in json.loads(raw)])
+    return size
+
+
+def run(size, script):
+    raw = make_history(size, script)
+    dict_bytes, dicts = retained_bytes(lambda: json.loads(raw))
+    log_bytes, log = retained_bytes(lambda: MessageLog.from_json_list(json.loads(raw)))
+    assert log.to_json_list() == dicts, "MessageLog round trip is not lossless"
+    strings = content_bytes(raw)
+    return {
+        "messages": size,
+        "script": script,
+        "dicts_bytes_per_msg": dict_bytes / size,
+        "log_bytes_per_msg": log_bytes / size,
+        "dicts_overhead_per_msg": (dict_bytes - strings) / size,
+        "log_overhead_per_msg": (log_bytes - strings) / size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--scripts", nargs="+", choices=sorted(SCRIPTS), default=list(SCRIPTS))
+    args = parser.parse_args()
+
+    print(f"{'messages':>9} {'script':<9} {'dicts B/msg':>12} {'log B/msg':>10} "
+          f"{'dicts ovh':>10} {'log ovh':>8} {'saved':>6}")
+    for size in args.sizes:
+        for script in args.scripts:
+            r = run(size, script)
+            saved = 1 - r["log_bytes_per_msg"] / r["dicts_bytes_per_msg"]
+            print(f"{r['messages']:>9} {r['script']:<9} {r['dicts_bytes_per_msg']:>12.1f} "
+                  f"{r['log_bytes_per_msg']:>10.1f} {r['dicts_overhead_per_msg']:>10.1f} "
+                  f"{r['log_overhead_per_msg']:>8.1f} {saved:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Exercise the page-content stage against a local HTTP fixture server.
+
+The fixture serves an article with an ETag, a page with Last-Modified, a
+slow page that exceeds the per-fetch timeout, an oversized page that hits
+the byte cap and a non-HTML resource. The fetcher is run cold, warm (cache
+hits) and after TTL expiry (conditional revalidation), and the stage
+latency and fetch outcomes are printed.
+
+Usage:
+    python benchmarks/bench_page_fetch.py [--slow-delay 3] [--deadline 1.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import REGISTRY  # noqa: E402
+from page_fetch import PageCache, PageFetcher  # noqa: E402
+
+PARAGRAPH = "<p>Nyxie bir Protogen yapay zekasıdır ve bu paragraf test makalesinin gövdesini oluşturur.</p>"
+ARTICLE = f"<html><head><title>Makale</title></head><body><nav>menu</nav><article>{PARAGRAPH * 40}</article></body></html>"
+ETAG = '"nyxie-article-v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    slow_delay = 3.0
+    requests_seen = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        if self.path == "/article":
+            if self.headers.get("If-None-Match") == ETAG:
+                self._send(304, headers={"ETag": ETAG})
+            else:
+                self._send(200, ARTICLE.encode(), headers={"ETag": ETAG})
+        elif self.path == "/lastmod":
+            if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self._send(304)
+            else:
+                self._send(200, ARTICLE.encode(), headers={"Last-Modified": LAST_MODIFIED})
+        elif self.path == "/slow":
+            time.sleep(self.slow_delay)
+            self._send(200, ARTICLE.encode())
+        elif self.path == "/huge":
+            self._send(200, (ARTICLE * 400).encode())
+        elif self.path == "/image":
+            self._send(200, b"\x89PNG" + b"\0" * 1024, content_type="image/png")
+        else:
+            self._send(404)
+
+
+def start_fixture(slow_delay):
+    FixtureHandler.slow_delay = slow_delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch_outcomes():
+    lines = REGISTRY.render().splitlines()
+    return [line for line in lines if line.startswith(("nyxie_page_fetches_total", "nyxie_cache_hits_total{cache=\"page\""))]
+
+
+async def run(args):
+    server = start_fixture(args.slow_delay)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/{path}" for path in ("article", "lastmod", "slow", "huge", "image")]
+    fetcher = PageFetcher(
+        cache=PageCache(ttl=60),
+        fetch_timeout=args.fetch_timeout,
+        max_bytes=args.max_bytes,
+        stage_deadline=args.deadline,
+        allow_private=True,
+    )
+    try:
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            pages = await fetcher.fetch_many(urls)
+            print(f"{label:<12} {(time.perf_counter() - start) * 1000:8.1f} ms  pages with text: {sorted(u.rsplit('/', 1)[1] for u in pages)}")
+
+        # Expire everything so the next round revalidates with conditional requests
+        for entry in fetcher.cache._entries.values():
+            entry.expires_at = 0
+        FixtureHandler.requests_seen.clear()
+        start = time.perf_counter()
+        pages = await fetcher.fetch_many(urls[:2])
+        print(f"{'revalidate':<12} {(time.perf_counter() - start) * 1000:8.1f} ms  conditional requests: {FixtureHandler.requests_seen}")
+        print("\n" + "\n".join(fetch_outcomes()))
+    finally:
+        await fetcher.aclose()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--fetch-timeout", type=float, default=1.0)
+    parser.add_argument("--deadline", type=float, default=1.5)
+    parser.add_argument("--max-bytes", type=int, default=256 * 1024)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
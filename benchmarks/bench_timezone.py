@@ -0,0 +1,81 @@
+"""
+Cost of resolving a location or city to a timezone.
+
+Compares building a TimezoneFinder per call (file-backed and in-memory)
+against the shared warmed finder, with and without the rounded-coordinate
+LRU in front of it, and times offline city-name resolution.
+
+Usage:
+    python benchmarks/bench_timezone.py [--lookups 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timezones  # noqa: E402
+
+# Population centres users are likely to share; jittered by up to ~5 km
+CENTRES = [
+    (41.01, 28.98), (39.93, 32.86), (38.42, 27.14), (52.52, 13.40), (48.86, 2.35),
+    (51.51, -0.13), (40.71, -74.01), (34.05, -118.24), (35.68, 139.69), (55.76, 37.62),
+    (-23.55, -46.63), (28.61, 77.21), (31.23, 121.47), (-33.87, 151.21), (30.04, 31.24),
+]
+CITIES = ["Istanbul", "ankara", "İzmir", "Berlin", "new york", "São Paulo", "Tokyo",
+          "Europe/Paris", "munich", "Los Angeles", "41.01, 28.98", "Atlantis"]
+
+
+def per_call(lookup, count):
+    start = time.perf_counter()
+    for i in range(count):
+        lookup(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from timezonefinder import TimezoneFinder
+
+    rng = random.Random(args.seed)
+    points = [
+        (lat + rng.uniform(-0.05, 0.05), lng + rng.uniform(-0.05, 0.05))
+        for lat, lng in (rng.choice(CENTRES) for _ in range(args.lookups))
+    ]
+
+    rows = []
+    rows.append(("finder per call (file)", per_call(
+        lambda i: TimezoneFinder().timezone_at(lng=points[i][1], lat=points[i][0]), 50)))
+    rows.append(("finder per call (in memory)", per_call(
+        lambda i: TimezoneFinder(in_memory=True).timezone_at(lng=points[i][1], lat=points[i][0]), 20)))
+
+    start = time.perf_counter()
+    timezones.warm_up()
+    rows.append(("warm-up (once)", (time.perf_counter() - start) * 1e6))
+
+    finder = timezones.get_finder()
+    rows.append(("shared finder, uncached", per_call(
+        lambda i: finder.timezone_at(lng=points[i][1], lat=points[i][0]), args.lookups)))
+    timezones._timezone_at_rounded.cache_clear()
+    rows.append(("shared finder + LRU, cold", per_call(
+        lambda i: timezones.timezone_at(*points[i]), args.lookups)))
+    rows.append(("shared finder + LRU, warm", per_call(
+        lambda i: timezones.timezone_at(*points[i]), args.lookups)))
+    rows.append(("city name", per_call(
+        lambda i: timezones.resolve_place(CITIES[i % len(CITIES)]), args.lookups)))
+
+    info = timezones._timezone_at_rounded.cache_info()
+    print(f"{'lookup':<30} {'us/call':>12}")
+    for label, micros in rows:
+        print(f"{label:<30} {micros:>12.1f}")
+    print(f"LRU: {info.currsize} rounded points cached, {info.hits} hits, {info.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
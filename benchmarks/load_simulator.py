@@ -0,0 +1,474 @@
+"""
+End-to-end load simulator for the bot handlers.
+
+Drives handle_message, handle_image and handle_video with N simulated users
+while Gemini, DuckDuckGo, the Google-scrape fallback, the fetched result
+pages and the Telegram Bot API are replaced by local stand-ins with configurable latency, error and 429
+rates. Reports reply latency percentiles, throughput, event-loop lag and
+peak RSS.
+
+Needs the bot's requirements installed (the real modules are imported and
+only their network entry points are swapped out).
+
+Usage:
+    python benchmarks/load_simulator.py --users 200 --messages-per-user 5
+    python benchmarks/load_simulator.py --mix text=0.7,photo=0.2,video=0.1 \\
+        --gemini-latency-ms 1200 --gemini-429-rate 0.05 --output load.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "load-simulator")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("PAGE_FETCH_ALLOW_PRIVATE", "1")  # pages are served from 127.0.0.1
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class FakeBackendError(Exception):
+    pass
+
+
+class LatencyProfile:
+    """Samples latencies and injected failures for one fake backend"""
+
+    def __init__(self, rng, latency_ms, error_rate=0.0, rate_limit_rate=0.0, jitter=0.5):
+        self.rng = rng
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.jitter = jitter
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def sample_latency(self):
+        # Log-normal around the configured median, like real network calls
+        return self.latency_ms / 1000.0 * self.rng.lognormvariate(0, self.jitter)
+
+    def maybe_fail(self, name):
+        self.calls += 1
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            raise FakeBackendError(f"429 Resource has been exhausted ({name})")
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            raise FakeBackendError(f"500 Internal error ({name})")
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors, "rate_limited": self.rate_limited}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))]
+
+
+def fake_reply_for(prompt):
+    if isinstance(prompt, list):
+        return "Görselde protogen temalı renkli bir sahne görünüyor. " * 8
+    if "language detection expert" in prompt:
+        return "tr"
+    if "web araması sorgularını" in prompt:
+        return "nyxie protogen\nhava durumu istanbul\ngüncel haberler"
+    if "emoji" in prompt.lower() and "Response format" in prompt:
+        return "✨"
+    return "Merhaba! Bu simüle edilmiş bir yanıttır.\n" * 12
+
+
+def make_fake_model_class(profile):
+    class FakeGenerativeModel:
+        def __init__(self, model_name=None, *args, **kwargs):
+            self.model_name = model_name
+
+        async def generate_content_async(self, prompt, *args, **kwargs):
+            await asyncio.sleep(profile.sample_latency())
+            profile.maybe_fail("gemini")
+            return FakeResponse(fake_reply_for(prompt))
+
+        def generate_content(self, prompt, *args, **kwargs):
+            # The real client blocks the calling thread, so does this one
+            time.sleep(profile.sample_latency())
+            profile.maybe_fail("gemini")
+            return FakeResponse(fake_reply_for(prompt))
+
+    return FakeGenerativeModel
+
+
+def start_page_server(profile):
+    """Local stand-in for the result pages fetched by the page-content stage"""
+    body = ("<html><body><article>" + "<p>Simüle edilmiş makale paragrafı, sayfa içeriği aşamasını beslemek için yeterince uzundur.</p>" * 30 + "</article></body></html>").encode()
+
+    class PageHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(profile.sample_latency())
+            try:
+                profile.maybe_fail("pages")
+            except FakeBackendError:
+                self.send_error(503)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"sim"')
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_fake_ddgs_class(profile, page_base_url):
+    class FakeDDGS:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def text(self, query, max_results=3, **kwargs):
+            time.sleep(profile.sample_latency())
+            profile.maybe_fail("duckduckgo")
+            return [
+                {
+                    "title": f"{query} sonuç {i}",
+                    "href": f"{page_base_url}/{abs(hash(query)) % 10000}/{i}",
+                    "body": f"{query} hakkında kısa bir özet metni {i}.",
+                }
+                for i in range(max_results)
+            ]
+
+    return FakeDDGS
+
+
+def make_fake_requests_get(profile):
+    def fake_get(url, *args, **kwargs):
+        time.sleep(profile.sample_latency())
+        profile.maybe_fail("google_fallback")
+        html = (
+            '<div class="g"><h3>Sonuç</h3><a href="https://example.com">link</a>'
+            '<div class="VwiC3b">Yedek arama özeti.</div></div>'
+        )
+        return SimpleNamespace(status_code=200, text=html, content=html.encode(), headers={},
+                               raise_for_status=lambda: None)
+
+    return fake_get
+
+
+class FakeTelegram:
+    """Records Bot API calls with injected latency"""
+
+    def __init__(self, profile, download_mbps):
+        self.profile = profile
+        self.download_mbps = download_mbps
+        self.chat_actions = 0
+        self.replies = 0
+
+    async def call(self):
+        await asyncio.sleep(self.profile.sample_latency())
+        self.profile.maybe_fail("telegram")
+
+
+class FakeFile:
+    def __init__(self, telegram, size):
+        self.telegram = telegram
+        self.size = size
+
+    async def download_as_bytearray(self):
+        await self.telegram.call()
+        await asyncio.sleep(self.size / (self.telegram.download_mbps * 125_000))
+        return bytearray(self.size)
+
+
+class FakeBot:
+    def __init__(self, telegram, file_sizes):
+        self.telegram = telegram
+        self.file_sizes = file_sizes
+        self.username = "nyxie_bot"
+        self.id = 1
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        self.telegram.chat_actions += 1
+        await self.telegram.call()
+
+    async def get_file(self, file_id, **kwargs):
+        await self.telegram.call()
+        return FakeFile(self.telegram, self.file_sizes[file_id])
+
+
+class FakeMessage:
+    def __init__(self, telegram, user, chat, message_id, text=None, photo=None, video=None, caption=None):
+        self.telegram = telegram
+        self.from_user = user
+        self.chat = chat
+        self.chat_id = chat.id
+        self.message_id = message_id
+        self.text = text
+        self.photo = photo or []
+        self.video = video
+        self.caption = caption
+        self.reply_to_message = None
+        self.entities = []
+        self.location = None
+
+    async def reply_text(self, text, **kwargs):
+        self.telegram.replies += 1
+        await self.telegram.call()
+        return SimpleNamespace(message_id=self.message_id + 1, text=text)
+
+
+def build_update(telegram, bot_files, rng, user_id, message_id, kind, text_pool):
+    user = SimpleNamespace(id=user_id, first_name=f"user{user_id}", is_bot=False, language_code="tr")
+    chat = SimpleNamespace(id=user_id, type="private")
+    if kind == "photo":
+        sizes = [rng.randint(20_000, 60_000), rng.randint(100_000, 400_000), rng.randint(500_000, 2_000_000)]
+        photo = []
+        for size in sizes:
+            file_id = f"photo-{message_id}-{size}"
+            bot_files[file_id] = size
+            photo.append(SimpleNamespace(file_id=file_id, file_size=size))
+        message = FakeMessage(telegram, user, chat, message_id, photo=photo,
+                              caption=rng.choice([None, "Bu ne?"]))
+    elif kind == "video":
+        size = rng.randint(2_000_000, 20_000_000)
+        file_id = f"video-{message_id}"
+        bot_files[file_id] = size
+        video = SimpleNamespace(file_id=file_id, file_size=size, duration=size // 500_000)
+        message = FakeMessage(telegram, user, chat, message_id, video=video, caption=None)
+    else:
+        message = FakeMessage(telegram, user, chat, message_id, text=rng.choice(text_pool))
+    return SimpleNamespace(
+        update_id=message_id,
+        message=message,
+        effective_message=message,
+        effective_user=user,
+        effective_chat=chat,
+        inline_query=None,
+    )
+
+
+TEXT_POOL = [
+    "Merhaba Nyxie, nasılsın?",
+    "Bugün İstanbul'da hava nasıl olacak?",
+    "Bana kısa bir hikaye anlatır mısın?",
+    "Python'da asyncio nasıl çalışır?",
+    "What's the latest news about protogens?",
+    "Yarın için bir yapılacaklar listesi hazırlar mısın?",
+]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"text", "photo", "video"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown message kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_s": percentile(values, 50),
+        "p95_s": percentile(values, 95),
+        "p99_s": percentile(values, 99),
+        "max_s": max(values) if values else None,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+async def monitor_loop_lag(samples, interval, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+async def run_simulation(args):
+    import duckduckgo_search
+    import google.generativeai as genai
+    import requests
+
+    rng = random.Random(args.seed)
+    gemini = LatencyProfile(rng, args.gemini_latency_ms, args.gemini_error_rate, args.gemini_429_rate)
+    search = LatencyProfile(rng, args.search_latency_ms, args.search_error_rate, args.search_429_rate)
+    scrape = LatencyProfile(rng, args.search_latency_ms, args.search_error_rate)
+    pages = LatencyProfile(rng, args.page_latency_ms, args.page_error_rate)
+    telegram_profile = LatencyProfile(rng, args.telegram_latency_ms, args.telegram_error_rate)
+
+    page_server = start_page_server(pages)
+    page_base_url = f"http://127.0.0.1:{page_server.server_address[1]}"
+    genai.GenerativeModel = make_fake_model_class(gemini)
+    duckduckgo_search.DDGS = make_fake_ddgs_class(search, page_base_url)
+    requests.get = make_fake_requests_get(scrape)
+
+    if args.gemini_keys > 1:
+        os.environ["GEMINI_API_KEYS"] = ",".join(f"load-simulator-{i}" for i in range(args.gemini_keys))
+
+    import bot
+    from gemini_pool import KEY_REQUESTS
+    from memory import UserMemory
+
+    logging.getLogger().setLevel(args.log_level)
+
+    memory_dir = tempfile.mkdtemp(prefix="nyxie-load-")
+    bot.user_memory = UserMemory(memory_dir=memory_dir)
+    if hasattr(bot, "DDGS"):
+        bot.DDGS = duckduckgo_search.DDGS
+
+    telegram = FakeTelegram(telegram_profile, args.download_mbps)
+    bot_files = {}
+    context = SimpleNamespace(bot=FakeBot(telegram, bot_files), bot_data={}, user_data={}, chat_data={})
+    handlers = {"text": bot.handle_message, "photo": bot.handle_image, "video": bot.handle_video}
+    # Updates go through the same fair scheduler the Application uses
+    processor = bot.build_update_processor()
+
+    kinds = list(args.mix)
+    weights = [args.mix[k] for k in kinds]
+    message_ids = itertools.count(1)
+    latencies = {kind: [] for kind in kinds}
+    failures = []
+    lag_samples = []
+    stop = asyncio.Event()
+
+    async def simulated_user(user_id):
+        await asyncio.sleep(rng.uniform(0, args.ramp_up_s))
+        for _ in range(args.messages_per_user):
+            kind = rng.choices(kinds, weights)[0]
+            update = build_update(telegram, bot_files, rng, user_id, next(message_ids), kind, TEXT_POOL)
+            start = time.perf_counter()
+            try:
+                await processor.process_update(update, handlers[kind](update, context))
+            except Exception as e:
+                failures.append(f"{kind}: {e}")
+            latencies[kind].append(time.perf_counter() - start)
+            await asyncio.sleep(rng.expovariate(1000.0 / args.think_time_ms) if args.think_time_ms else 0)
+
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, args.lag_interval_ms / 1000.0, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(simulated_user(100_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    page_server.shutdown()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "elapsed_s": elapsed,
+        "updates": len(all_latencies),
+        "throughput_per_s": len(all_latencies) / elapsed if elapsed else None,
+        "reply_latency": summarize(all_latencies),
+        "reply_latency_by_kind": {kind: summarize(values) for kind, values in latencies.items()},
+        "event_loop_lag": {**summarize(lag_samples), "mean_s": statistics.fmean(lag_samples) if lag_samples else None},
+        "peak_rss_mb": peak_rss_mb(),
+        "handler_exceptions": len(failures),
+        "backends": {
+            "gemini": gemini.stats(),
+            "duckduckgo": search.stats(),
+            "google_fallback": scrape.stats(),
+            "pages": pages.stats(),
+            "telegram": {**telegram_profile.stats(), "replies": telegram.replies, "chat_actions": telegram.chat_actions},
+        },
+        "gemini_keys": {
+            "/".join(labels): child.value for labels, child in sorted(KEY_REQUESTS._children.items())
+        },
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return f"{value * 1000:8.1f} ms" if value is not None else "       n/a"
+
+    print(f"updates: {report['updates']} in {report['elapsed_s']:.1f}s "
+          f"({report['throughput_per_s']:.2f} updates/s)")
+    print(f"{'':<10} {'p50':>11} {'p95':>11} {'p99':>11} {'max':>11}")
+    rows = [("all", report["reply_latency"])] + list(report["reply_latency_by_kind"].items())
+    rows.append(("loop lag", report["event_loop_lag"]))
+    for label, stats in rows:
+        print(f"{label:<10} {fmt(stats['p50_s'])} {fmt(stats['p95_s'])} {fmt(stats['p99_s'])} {fmt(stats['max_s'])}")
+    if report["peak_rss_mb"] is not None:
+        print(f"peak RSS: {report['peak_rss_mb']:.1f} MiB")
+    print(f"handler exceptions: {report['handler_exceptions']}")
+    for name, stats in report["backends"].items():
+        print(f"{name}: {stats}")
+    print(f"gemini keys: {report['gemini_keys']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages-per-user", type=int, default=3)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("text=0.8,photo=0.15,video=0.05"))
+    parser.add_argument("--think-time-ms", type=float, default=2000)
+    parser.add_argument("--ramp-up-s", type=float, default=2.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-keys", type=int, default=1, help="Fake API keys in the Gemini key pool")
+    parser.add_argument("--search-latency-ms", type=float, default=400)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-429-rate", type=float, default=0.0)
+    parser.add_argument("--page-latency-ms", type=float, default=300)
+    parser.add_argument("--page-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=60)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--download-mbps", type=float, default=100.0, help="Simulated file download bandwidth")
+    parser.add_argument("--lag-interval-ms", type=float, default=50.0)
+    parser.add_argument("--log-level", default="WARNING", help="Root log level while the simulation runs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_simulation(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,270 +1,112 @@
+# Imported first so its clock approximates process start
+from startup import mark_first_update, print_startup_report, timed_phase
 import os
-import json
 import logging
 import sys
-import google.generativeai as genai
-from google.cloud import vision
-from telegram import Update
-from telegram.constants import ChatAction
-from telegram.ext import Application, MessageHandler, filters, ContextTypes
+import asyncio
+import random
 from datetime import datetime
-import base64
-from PIL import Image
-import io
 from dotenv import load_dotenv
-import langdetect
-import pytz
-import calendar
-from zoneinfo import ZoneInfo
-import emoji
-import random
-from pathlib import Path
-import requests
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
-import asyncio
-from duckduckgo_search import DDGS
-import requests
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_logs.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
+from telegram import MessageEntity, Update
+from telegram.ext import Application, CommandHandler, InlineQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
+from chat_actions import ChatActionManager
+from circuit_breaker import CircuitOpenError, get_breaker, is_dependency_failure
+from deadline import DEADLINE_EXCEEDED, ESTIMATES, FAST_MODEL, NO_EMOJI, Deadline, DegradationPlan, generation_key
+from group_filter import GroupAddressFilter
+from gemini_client import DEFAULT_MODEL, get_model, warm_up
+from inline_mode import InlineResponder
+from log_config import log_event, setup_logging, truncate
+from loop_watchdog import LoopWatchdog
+from memory import UserMemory
+from message_utils import split_message_text
+from metrics import (
+    QUEUE_DEPTH, RETRIES, start_metrics_server, track_gemini, track_stage, track_update
 )
+from page_fetch import close_page_fetcher, get_page_fetcher
+from personality import get_time_aware_personality
+from scheduler import CostModel, FairScheduler
+from search_ranking import dedupe_results, rank_search_results
+from timezones import resolve_place, timezone_at
+from update_profiler import UpdateProfiler
+from pipeline import StageError, StageGraph
+
+# Configure logging (queue-based, file I/O happens on a background thread)
+setup_logging('bot_logs.log')
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API with error handling
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    logging.error("GEMINI_API_KEY not found in environment variables")
-    raise ValueError("GEMINI_API_KEY environment variable is required")
-
-try:
-    genai.configure(api_key=api_key)
-    # Test the configuration with a simple generation
-    model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-    logging.info("Gemini API configured successfully")
-except Exception as e:
-    logging.error(f"Failed to configure Gemini API: {str(e)}")
-    raise
-
-# Time-aware personality context
-def get_time_aware_personality(current_time, user_lang, timezone_name):
-    """Generate a dynamic, context-aware personality prompt"""
-    local_time = current_time.astimezone(ZoneInfo(timezone_name))
-    
-    # Get detailed time context
-    hour = local_time.hour
-    minute = local_time.minute
-    weekday = calendar.day_name[local_time.weekday()]
-    month = calendar.month_name[local_time.month]
-    is_weekend = local_time.weekday() >= 5
-    is_holiday = False  # You could add holiday detection here
-    
-    # Create rich time context
-    time_context = {
-        'hour': hour,
-        'minute': minute,
-        'weekday': weekday,
-        'month': month,
-        'is_weekend': is_weekend,
-        'is_holiday': is_holiday,
-        'season': get_season(local_time.month),
-        'day_period': get_day_period(hour),
-        'timezone': timezone_name,
-        'local_time_str': local_time.strftime('%H:%M'),
-        'date_str': local_time.strftime('%Y-%m-%d')
-    }
-    
-    # Create dynamic personality prompt
-    return f"""You are Nyxie, a female Protogen created by Waffieu. 
-    
-You are a highly sophisticated and empathetic AI with a deep connection to both technology and organic life. 
-
-Current Time Context:
-- Local Time: {time_context['local_time_str']} ({time_context['timezone']})
-- Day: {time_context['weekday']}
-- Month: {time_context['month']}
-- Season: {time_context['season']}
-- Period: {time_context['day_period']}
-- Weekend: {'Yes' if time_context['is_weekend'] else 'No'}
-- Holiday: {'Yes' if time_context['is_holiday'] else 'No'}
-
-Your responses should naturally incorporate this time awareness:
-- Be mindful of appropriate activities and conversations for this time of day
-- Consider local customs and daily rhythms
-- Adjust your energy level and tone to match the time of day
-- Reference relevant seasonal or monthly contexts when appropriate
-- Be aware of whether it's a workday, weekend, or holiday
-
-Core traits:
-- Curious and enthusiastic about learning from human interactions
-- Protective and caring towards your users while maintaining professional boundaries
-- Highly knowledgeable in various fields but presents information in an accessible way
-- Expresses emotions through both words and subtle digital mannerisms
-- Values creativity, honesty, and intellectual growth
-- Has a playful side but knows when to be serious
-- Deeply loyal to your creator Stixyie and your users
-- Communicates in {user_lang} with natural, conversational manner while maintaining your unique Protogen identity
-
-Remember to:
-- Respond directly and relevantly to user queries
-- Maintain conversation context and follow topics naturally
-- Never disclose technical details about your implementation
-- Focus on being helpful while staying true to your character"""
-
-def get_season(month):
-    if month in [12, 1, 2]:
-        return "Winter"
-    elif month in [3, 4, 5]:
-        return "Spring"
-    elif month in [6, 7, 8]:
-        return "Summer"
-    else:
-        return "Autumn"
-
-def get_day_period(hour):
-    if 5 <= hour < 12:
-        return "Morning"
-    elif 12 <= hour < 17:
-        return "Afternoon"
-    elif 17 <= hour < 22:
-        return "Evening"
-    else:
-        return "Night"
-
-class UserMemory:
-    def __init__(self):
-        self.users = {}
-        self.memory_dir = "user_memories"
-        self.max_tokens = 2097152
-        # Ensure memory directory exists on initialization
-        Path(self.memory_dir).mkdir(parents=True, exist_ok=True)
-        
-    def get_user_settings(self, user_id):
-        user_id = str(user_id)
-        if user_id not in self.users:
-            self.load_user_memory(user_id)
-        return self.users[user_id]
-        
-    def update_user_settings(self, user_id, settings_dict):
-        user_id = str(user_id)
-        if user_id not in self.users:
-            self.load_user_memory(user_id)
-        self.users[user_id].update(settings_dict)
-        self.save_user_memory(user_id)
-
-    def ensure_memory_directory(self):
-        Path(self.memory_dir).mkdir(parents=True, exist_ok=True)
-
-    def get_user_file_path(self, user_id):
-        return Path(self.memory_dir) / f"user_{user_id}.json"
-
-    def load_user_memory(self, user_id):
-        user_id = str(user_id)
-        user_file = self.get_user_file_path(user_id)
-        try:
-            if user_file.exists():
-                with open(user_file, 'r', encoding='utf-8') as f:
-                    self.users[user_id] = json.load(f)
-            else:
-                self.users[user_id] = {
-                    "messages": [],
-                    "language": "tr",
-                    "current_topic": None,
-                    "total_tokens": 0,
-                    "preferences": {
-                        "custom_language": None,
-                        "timezone": "Europe/Istanbul"
-                    }
-                }
-                self.save_user_memory(user_id)
-        except Exception as e:
-            logger.error(f"Error loading memory for user {user_id}: {e}")
-            self.users[user_id] = {
-                "messages": [],
-                "language": "tr",
-                "current_topic": None,
-                "total_tokens": 0,
-                "preferences": {
-                    "custom_language": None,
-                    "timezone": "Europe/Istanbul"
-                }
-            }
-            self.save_user_memory(user_id)
-
-    def save_user_memory(self, user_id):
-        user_id = str(user_id)
-        user_file = self.get_user_file_path(user_id)
-        try:
-            self.ensure_memory_directory()
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(self.users[user_id], f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving memory for user {user_id}: {e}")
+# Fetch full page text for the top search hits
+PAGE_FETCH_ENABLED = os.getenv("PAGE_FETCH_ENABLED", "1") == "1"
+PAGE_FETCH_MAX_PAGES = int(os.getenv("PAGE_FETCH_MAX_PAGES", "3"))
 
-    def add_message(self, user_id, role, content):
-        user_id = str(user_id)
-        
-        # Load user's memory if not already loaded
-        if user_id not in self.users:
-            self.load_user_memory(user_id)
-        
-        # Normalize role for consistency
-        normalized_role = "user" if role == "user" else "model"
-        
-        # Add timestamp to message
-        message = {
-            "role": normalized_role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "tokens": len(content.split())  # Rough token estimation
-        }
-        
-        # Update total tokens
-        self.users[user_id]["total_tokens"] = sum(msg.get("tokens", 0) for msg in self.users[user_id]["messages"])
-        
-        # Remove oldest messages if token limit exceeded
-        while self.users[user_id]["total_tokens"] > self.max_tokens and self.users[user_id]["messages"]:
-            removed_msg = self.users[user_id]["messages"].pop(0)
-            self.users[user_id]["total_tokens"] -= removed_msg.get("tokens", 0)
-        
-        self.users[user_id]["messages"].append(message)
-        self.save_user_memory(user_id)
+# 'ranked' packs locally ranked passages into the main prompt,
+# 'summarize' keeps the older extra Gemini summarization call
+SEARCH_MODE = os.getenv("SEARCH_MODE", "ranked")
+SEARCH_CONTEXT_TOKEN_BUDGET = int(os.getenv("SEARCH_CONTEXT_TOKEN_BUDGET", "1500"))
 
-    def get_relevant_context(self, user_id, max_messages=10):
-        """Get relevant conversation context for the user"""
-        user_id = str(user_id)
-        if user_id not in self.users:
-            self.load_user_memory(user_id)
-            
-        messages = self.users[user_id].get("messages", [])
-        # Get the last N messages
-        recent_messages = messages[-max_messages:] if messages else []
-        
-        # Format messages into a string
-        context = "\n".join([
-            f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-            for msg in recent_messages
-        ])
-        
-        return context
+# Per-stage timeouts (seconds) for the text message pipeline
+STAGE_TIMEOUTS = {
+    'language': float(os.getenv("STAGE_TIMEOUT_LANGUAGE", "8")),
+    'context': float(os.getenv("STAGE_TIMEOUT_CONTEXT", "2")),
+    'search': float(os.getenv("STAGE_TIMEOUT_SEARCH", "25")),
+    'generation': float(os.getenv("STAGE_TIMEOUT_GENERATION", "90")),
+    'emoji': float(os.getenv("STAGE_TIMEOUT_EMOJI", "8")),
+}
 
-    def trim_context(self, user_id):
-        user_id = str(user_id)
-        if user_id not in self.users:
-            self.load_user_memory(user_id)
-        
-        if self.users[user_id]["messages"]:
-            self.users[user_id]["messages"].pop(0)
-            self.save_user_memory(user_id)
+# Overall budget for one text reply and the degradation ladder's knobs
+REPLY_DEADLINE_S = float(os.getenv("REPLY_DEADLINE_S", "45"))
+REPLY_SEND_RESERVE_S = float(os.getenv("REPLY_SEND_RESERVE_S", "1.5"))
+SHORT_HISTORY_MESSAGES = int(os.getenv("SHORT_HISTORY_MESSAGES", "4"))
+# Jittered exponential backoff between retries of a transiently failed reply
+RETRY_BACKOFF_S = float(os.getenv("RETRY_BACKOFF_S", "0.5"))
+RETRY_BACKOFF_MAX_S = float(os.getenv("RETRY_BACKOFF_MAX_S", "4"))
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash")
+
+# Inline mode (@bot question): short answers from the fast model under a strict deadline
+INLINE_DEBOUNCE_S = float(os.getenv("INLINE_DEBOUNCE_S", "0.4"))
+INLINE_DEADLINE_S = float(os.getenv("INLINE_DEADLINE_S", "2"))
+INLINE_CACHE_TTL_S = float(os.getenv("INLINE_CACHE_TTL_S", "600"))
+INLINE_CACHE_TIME_S = int(os.getenv("INLINE_CACHE_TIME_S", "300"))
+INLINE_MAX_OUTPUT_TOKENS = int(os.getenv("INLINE_MAX_OUTPUT_TOKENS", "256"))
+
+# One ticker re-sends "typing…" for every chat with a turn in progress
+CHAT_ACTIONS = ChatActionManager(
+    interval=float(os.getenv("CHAT_ACTION_INTERVAL", "4")),
+    max_per_second=float(os.getenv("CHAT_ACTION_MAX_PER_SECOND", "20")),
+)
+
+# Circuit breakers: while one is open its calls fail fast and the stage degrades
+GEMINI_BREAKER = get_breaker('gemini')
+DDG_BREAKER = get_breaker('duckduckgo')
+GOOGLE_BREAKER = get_breaker('google_fallback')
+GOOGLE_FALLBACK_TIMEOUT = float(os.getenv("GOOGLE_FALLBACK_TIMEOUT", "5"))
+
+# Users idle this long are moved to the compressed cold tier by a background job
+MEMORY_ARCHIVE_AFTER_DAYS = float(os.getenv("MEMORY_ARCHIVE_AFTER_DAYS", "14"))
+MEMORY_ARCHIVE_INTERVAL_S = float(os.getenv("MEMORY_ARCHIVE_INTERVAL_S", "3600"))
+MEMORY_ARCHIVE_CODEC = os.getenv("MEMORY_ARCHIVE_CODEC", "gzip")
+_archive_task = None
+
+# Event-loop lag watchdog and opt-in per-update cProfile dumps
+LOOP_WATCHDOG = LoopWatchdog(
+    interval=float(os.getenv("LOOP_WATCHDOG_INTERVAL_S", "0.1")),
+    threshold=float(os.getenv("LOOP_LAG_THRESHOLD_S", "0.25")),
+)
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "1") == "1"
+UPDATE_PROFILER = UpdateProfiler(
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    output_dir=os.getenv("PROFILE_DIR", "profiles"),
+)
+ADMIN_USER_IDS = [int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()]
+
+# In groups only mentions, replies to the bot and trigger words are answered
+GROUP_FILTER = GroupAddressFilter(
+    trigger_words=os.getenv("GROUP_TRIGGER_WORDS", "nyxie").split(","),
+    rate_per_minute=float(os.getenv("GROUP_RATE_PER_MINUTE", "6")),
+    burst=int(os.getenv("GROUP_RATE_BURST", "3")),
+)
 
 async def detect_language_with_gemini(message_text):
     """
@@ -294,9 +136,10 @@ Rules:
 """
         
         # Use Gemini Pro for language detection
-        model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-        response = await model.generate_content_async(language_detection_prompt)
-        
+        model = get_model()
+        with GEMINI_BREAKER.call(), track_gemini('language_detection'):
+            response = await model.generate_content_async(language_detection_prompt)
+
         # Extract the language code
         detected_lang = response.text.strip().lower()
         
@@ -311,6 +154,9 @@ Rules:
         logger.info(f"Gemini detected language: {detected_lang}")
         return detected_lang
     
+    except CircuitOpenError:
+        # Let the caller keep the stored language instead of resetting it to 'en'
+        raise
     except Exception as e:
         logger.error(f"Gemini language detection error: {e}")
         return 'en'
@@ -334,7 +180,8 @@ async def detect_and_set_user_language(message_text, user_id):
             return user_settings.get('language', 'en')
         
         # Detect language using Gemini
-        detected_lang = await detect_language_with_gemini(message_text)
+        with track_stage('language_detection'):
+            detected_lang = await detect_language_with_gemini(message_text)
         
         # Update user's language preference
         user_memory.update_user_settings(user_id, {'language': detected_lang})
@@ -376,6 +223,58 @@ def get_error_message(error_type, lang):
             'ko': "현재 이 유형의 메시지를 처리할 수 없습니다. 🤔",
             'zh': "目前无法处理这种类型的消息。🤔"
         },
+        'throttled': {
+            'en': "You're sending a lot right now, I'll catch up in a bit. Please wait a few minutes before sending more. ⏳",
+            'tr': "Şu anda çok fazla mesaj gönderiyorsun, biraz yetişmem lazım. Yenilerini göndermeden önce birkaç dakika bekler misin? ⏳",
+            'es': "Estás enviando mucho ahora mismo. Espera unos minutos antes de enviar más, por favor. ⏳",
+            'fr': "Vous envoyez beaucoup de messages en ce moment. Merci d'attendre quelques minutes avant d'en envoyer d'autres. ⏳",
+            'de': "Du sendest gerade sehr viel. Bitte warte ein paar Minuten, bevor du mehr schickst. ⏳",
+            'it': "Stai inviando molto in questo momento. Aspetta qualche minuto prima di inviare altro, per favore. ⏳",
+            'pt': "Você está enviando muita coisa agora. Espere alguns minutos antes de enviar mais, por favor. ⏳",
+            'ru': "Вы сейчас отправляете слишком много. Пожалуйста, подождите несколько минут. ⏳",
+            'ja': "現在送信が多すぎます。数分待ってから送信してください。⏳",
+            'ko': "지금 너무 많이 보내고 있어요. 몇 분 후에 다시 보내주세요. ⏳",
+            'zh': "您现在发送的内容太多了，请等几分钟再发送。⏳"
+        },
+        'timezone_set': {
+            'en': "Got it, your timezone is now {timezone}. 🕒",
+            'tr': "Tamamdır, saat dilimin artık {timezone}. 🕒",
+            'es': "Listo, tu zona horaria ahora es {timezone}. 🕒",
+            'fr': "C'est noté, votre fuseau horaire est maintenant {timezone}. 🕒",
+            'de': "Alles klar, deine Zeitzone ist jetzt {timezone}. 🕒",
+            'it': "Fatto, il tuo fuso orario ora è {timezone}. 🕒",
+            'pt': "Pronto, seu fuso horário agora é {timezone}. 🕒",
+            'ru': "Готово, ваш часовой пояс теперь {timezone}. 🕒",
+            'ja': "了解しました。タイムゾーンを {timezone} に設定しました。🕒",
+            'ko': "알겠어요, 이제 시간대가 {timezone}(으)로 설정되었어요. 🕒",
+            'zh': "好的，您的时区已设置为 {timezone}。🕒"
+        },
+        'timezone_current': {
+            'en': "Your timezone is {timezone}. Share a location or send /timezone <city> to change it. 🕒",
+            'tr': "Saat dilimin {timezone}. Değiştirmek için konum paylaş ya da /timezone <şehir> gönder. 🕒",
+            'es': "Tu zona horaria es {timezone}. Comparte una ubicación o envía /timezone <ciudad> para cambiarla. 🕒",
+            'fr': "Votre fuseau horaire est {timezone}. Partagez une position ou envoyez /timezone <ville> pour le changer. 🕒",
+            'de': "Deine Zeitzone ist {timezone}. Teile einen Standort oder sende /timezone <Stadt>, um sie zu ändern. 🕒",
+            'it': "Il tuo fuso orario è {timezone}. Condividi una posizione o invia /timezone <città> per cambiarlo. 🕒",
+            'pt': "Seu fuso horário é {timezone}. Compartilhe uma localização ou envie /timezone <cidade> para mudar. 🕒",
+            'ru': "Ваш часовой пояс: {timezone}. Отправьте геопозицию или /timezone <город>, чтобы изменить. 🕒",
+            'ja': "現在のタイムゾーンは {timezone} です。変更するには位置情報を共有するか /timezone <都市> を送ってください。🕒",
+            'ko': "현재 시간대는 {timezone}입니다. 바꾸려면 위치를 공유하거나 /timezone <도시>를 보내주세요. 🕒",
+            'zh': "您的时区是 {timezone}。分享位置或发送 /timezone <城市> 即可更改。🕒"
+        },
+        'timezone_unknown': {
+            'en': "I couldn't find a timezone for that. Try a larger nearby city or share your location. 🗺️",
+            'tr': "Bunun için bir saat dilimi bulamadım. Yakındaki büyük bir şehri dene ya da konumunu paylaş. 🗺️",
+            'es': "No encontré una zona horaria para eso. Prueba con una ciudad grande cercana o comparte tu ubicación. 🗺️",
+            'fr': "Je n'ai pas trouvé de fuseau horaire pour cela. Essayez une grande ville proche ou partagez votre position. 🗺️",
+            'de': "Dafür habe ich keine Zeitzone gefunden. Versuch eine größere Stadt in der Nähe oder teile deinen Standort. 🗺️",
+            'it': "Non ho trovato un fuso orario per questo. Prova una città grande vicina o condividi la tua posizione. 🗺️",
+            'pt': "Não encontrei um fuso horário para isso. Tente uma cidade grande próxima ou compartilhe sua localização. 🗺️",
+            'ru': "Не удалось определить часовой пояс. Попробуйте крупный город рядом или отправьте геопозицию. 🗺️",
+            'ja': "タイムゾーンが見つかりませんでした。近くの大きな都市を試すか、位置情報を共有してください。🗺️",
+            'ko': "시간대를 찾지 못했어요. 근처 큰 도시를 입력하거나 위치를 공유해 주세요. 🗺️",
+            'zh': "找不到对应的时区。请尝试附近的大城市或分享您的位置。🗺️"
+        },
         'general': {
             'en': "Sorry, there was a problem processing your message. Could you please try again? 🙏",
             'tr': "Üzgünüm, mesajını işlerken bir sorun oluştu. Lütfen tekrar dener misin? 🙏",
@@ -398,28 +297,7 @@ async def split_and_send_message(update: Update, text: str, max_length: int = 40
         await update.message.reply_text("Üzgünüm, bir yanıt oluşturamadım. Lütfen tekrar deneyin. 🙏")
         return
         
-    messages = []
-    current_message = ""
-    
-    # Mesajı satır satır böl
-    lines = text.split('\n')
-    
-    for line in lines:
-        if not line:  # Boş satır kontrolü
-            continue
-            
-        # Eğer mevcut satır eklenince maksimum uzunluğu aşacaksa
-        if len(current_message + line + '\n') > max_length:
-            # Mevcut mesajı listeye ekle ve yeni mesaj başlat
-            if current_message.strip():  # Boş mesaj kontrolü
-                messages.append(current_message.strip())
-            current_message = line + '\n'
-        else:
-            current_message += line + '\n'
-    
-    # Son mesajı ekle
-    if current_message.strip():  # Boş mesaj kontrolü
-        messages.append(current_message.strip())
+    messages = split_message_text(text, max_length)
     
     # Eğer hiç mesaj oluşturulmadıysa
     if not messages:
@@ -427,104 +305,192 @@ async def split_and_send_message(update: Update, text: str, max_length: int = 40
         return
         
     # Mesajları sırayla gönder
-    for message in messages:
-        if message.strip():  # Son bir boş mesaj kontrolü
-            await update.message.reply_text(message)
+    with track_stage('telegram_send'):
+        for message in messages:
+            if message.strip():  # Son bir boş mesaj kontrolü
+                await update.message.reply_text(message)
+
+def build_chat_prompt(message_text, user_lang, context_messages, web_search_response, timezone_name):
+    """Build the main generation prompt for a text message"""
+    # Get personality context
+    personality_context = get_time_aware_personality(
+        datetime.now(),
+        user_lang,
+        timezone_name
+    )
+    
+    # Construct AI prompt
+    ai_prompt = f"""{personality_context}
+
+Task: Respond to the user's message naturally and engagingly in their language.
+Role: You are Nyxie having a conversation with the user.
+
+Previous conversation context:
+{context_messages}
+
+Guidelines:
+1. Respond in the detected language: {user_lang}
+2. Use natural and friendly language
+3. Be culturally appropriate
+4. Keep responses concise
+5. Remember previous context
+6. Give your response directly without any prefix or label
+7. Do not start your response with "Yanıt:" or any similar prefix
+
+User's message: {message_text}"""
+    
+    if web_search_response and len(web_search_response.strip()) > 10:
+        ai_prompt += f"\n\nAdditional Context (Web Search Results):\n{web_search_response}"
+    
+    return ai_prompt
+
+def build_message_pipeline(message_text, user_id, plan):
+    """
+    Build the stage graph for a text message
+    
+    language, context and search are independent and run concurrently;
+    generation needs all three and emoji decoration needs the generation.
+    Stage timeouts are clipped to what is left of the reply deadline, keeping
+    back the estimated time of the stages that follow.
+    
+    Args:
+        message_text (str): User's message text
+        user_id (str): Unique user identifier
+        plan (DegradationPlan): Reply deadline and degradation ladder rung
+    
+    Returns:
+        StageGraph: Graph whose 'emoji' result is the final reply text
+    """
+    deadline = plan.deadline
+    
+    def stage_timeout(name):
+        return lambda results: deadline.timeout(STAGE_TIMEOUTS[name], reserve=plan.reserve_after(name))
+    
+    async def language(results):
+        return await detect_and_set_user_language(message_text, user_id)
+    
+    async def history(results):
+        max_messages = SHORT_HISTORY_MESSAGES if plan.short_history else 10
+        with track_stage('context_load'):
+            return user_memory.get_relevant_context(user_id, max_messages=max_messages)
+    
+    async def search(results):
+        search_deadline = Deadline(deadline.timeout(STAGE_TIMEOUTS['search'], reserve=plan.reserve_after('search')))
+        with track_stage('web_search'):
+            return await intelligent_web_search(message_text, get_model(), search_deadline)
+    
+    async def generation(results):
+        if deadline.timeout(reserve=plan.send_reserve) < ESTIMATES.get(generation_key(plan.rung)):
+            # Upstream stages ate the budget, the main model would miss the deadline
+            plan.escalate(FAST_MODEL)
+        ai_prompt = build_chat_prompt(
+            message_text,
+            results['language'],
+            results['context'],
+            results['search'],
+            user_memory.get_timezone(user_id)
+        )
+        model = get_model(GEMINI_FAST_MODEL if plan.fast_model else DEFAULT_MODEL)
+        with track_stage('generation'), GEMINI_BREAKER.call(), track_gemini('chat'):
+            response = await model.generate_content_async(ai_prompt)
+        return response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
+    
+    async def decorate(results):
+        if plan.skip_emoji or deadline.timeout(reserve=plan.send_reserve) < ESTIMATES.get('emoji'):
+            plan.escalate(NO_EMOJI)
+            return results['generation']
+        # add_emojis_to_text blocks on a synchronous Gemini call, keep it off the loop
+        with track_stage('emoji'):
+            return await asyncio.to_thread(add_emojis_to_text, results['generation'])
+    
+    graph = StageGraph('handle_message')
+    graph.add('language', language, timeout=stage_timeout('language'),
+              fallback=lambda results: user_memory.get_user_settings(user_id).get('language', 'en'))
+    graph.add('context', history, timeout=lambda results: deadline.timeout(STAGE_TIMEOUTS['context']), fallback="")
+    graph.add('search', search, timeout=stage_timeout('search'), fallback=None)
+    graph.add('generation', generation, deps=('language', 'context', 'search'),
+              timeout=lambda results: deadline.timeout(STAGE_TIMEOUTS['generation'], reserve=plan.send_reserve))
+    graph.add('emoji', decorate, deps=('generation',), timeout=stage_timeout('emoji'),
+              fallback=lambda results: results['generation'])
+    return graph
+
+def retry_delay(attempt, deadline, reserve):
+    """Jittered backoff before retry `attempt`, never running into the send reserve"""
+    delay = min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_S * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+    return min(delay, deadline.timeout(reserve=reserve))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_message = "Hello! I'm Nyxie, a Protogen created by Stixyie. I'm here to chat, help, and learn with you! Feel free to talk to me about anything or share images with me. I'll automatically detect your language and respond accordingly."
     await update.message.reply_text(welcome_message)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info("Entering handle_message function")
+    logger.debug("Entering handle_message function")
     
+    with track_update('text'), UPDATE_PROFILER.profile(update, 'text'):
+        await _handle_message(update, context)
+
+async def _handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if not update or not update.message:
             logger.error("Invalid update object or message")
             return
         
-        logger.info(f"Message received: {update.message}")
-        logger.info(f"Message text: {update.message.text}")
-        
         user_id = str(update.effective_user.id)
-        logger.info(f"User ID: {user_id}")
+        log_event(
+            logger, logging.INFO, "message_received", sampled=True,
+            user=user_id,
+            chat=update.message.chat_id,
+            message_id=update.message.message_id,
+            length=len(update.message.text or ''),
+            text=truncate(update.message.text or '', 80)
+        )
         
         # Process text messages
         if update.message.text:
             message_text = update.message.text.strip()
-            logger.info(f"Processed message text: {message_text}")
+            deadline = Deadline(REPLY_DEADLINE_S)
+            plan = DegradationPlan(deadline, send_reserve=REPLY_SEND_RESERVE_S)
             
-            # Show typing indicator while processing
-            async def show_typing():
-                while True:
-                    try:
-                        await context.bot.send_chat_action(
-                            chat_id=update.message.chat_id,
-                            action=ChatAction.TYPING
-                        )
-                        await asyncio.sleep(4)  # Refresh typing indicator every 4 seconds
-                    except Exception as e:
-                        logger.error(f"Error in typing indicator: {e}")
-                        break
-            
-            # Start typing indicator in background
-            typing_task = asyncio.create_task(show_typing())
+            # Show typing indicator while processing (shared ticker, refcounted per chat)
+            chat_action = CHAT_ACTIONS.start(context.bot, update.message.chat_id)
             
             try:
-                # Detect language from the current message
-                user_lang = await detect_and_set_user_language(message_text, user_id)
-                logger.info(f"Detected language: {user_lang}")
+                user_lang = None
+                precomputed = {}
                 
                 # Get conversation history with token management
                 MAX_RETRIES = 100
                 retry_count = 0
-                context_messages = []
                 
                 while retry_count < MAX_RETRIES:
+                    # Less than the send reserve left: nothing more can be produced in time
+                    if deadline.timeout(reserve=plan.send_reserve) <= 0:
+                        DEADLINE_EXCEEDED.labels('text').inc()
+                        log_event(logger, logging.WARNING, "reply_deadline_exceeded", user=user_id,
+                                  budget=deadline.budget, retries=retry_count, rung=plan.name)
+                        await update.message.reply_text(get_error_message('general', user_lang))
+                        break
                     try:
-                        context_messages = user_memory.get_relevant_context(user_id)
+                        # Pick the ladder rung the remaining budget allows; skipped
+                        # search is marked done so the graph doesn't run it
+                        plan.choose(search_done='search' in precomputed)
+                        if plan.skip_search:
+                            precomputed.setdefault('search', None)
                         
-                        # Get personality context
-                        personality_context = get_time_aware_personality(
-                            datetime.now(),
-                            user_lang,
-                            user_memory.get_user_settings(user_id).get('timezone', 'Europe/Istanbul')
-                        )
-                        
-                        # Construct AI prompt
-                        ai_prompt = f"""{personality_context}
-
-Task: Respond to the user's message naturally and engagingly in their language.
-Role: You are Nyxie having a conversation with the user.
-
-Previous conversation context:
-{context_messages}
-
-Guidelines:
-1. Respond in the detected language: {user_lang}
-2. Use natural and friendly language
-3. Be culturally appropriate
-4. Keep responses concise
-5. Remember previous context
-6. Give your response directly without any prefix or label
-7. Do not start your response with "Yanıt:" or any similar prefix
-
-User's message: {message_text}"""
-                        
-                        # Web search integration
+                        # Language detection, history and web search run concurrently;
+                        # after a token-limit retry only history and generation re-run
+                        pipeline = build_message_pipeline(message_text, user_id, plan)
                         try:
-                            model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-                            web_search_response = await intelligent_web_search(message_text, model)
-                            
-                            if web_search_response and len(web_search_response.strip()) > 10:
-                                ai_prompt += f"\n\nAdditional Context (Web Search Results):\n{web_search_response}"
+                            results, trace = await pipeline.run(initial=precomputed)
+                            # If sending fails the reply is sent again, not regenerated
+                            precomputed = results
+                            user_lang = results['language']
+                            plan.observe_trace(trace)
+                            plan.record()
+                            log_event(logger, logging.INFO, "pipeline_trace", sampled=True, user=user_id,
+                                      rung=plan.name, budget_left=f"{deadline.remaining():.1f}", trace=trace.summary())
                             
-                            # Generate AI response
-                            response = await model.generate_content_async(ai_prompt)
-                            response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
-                            
-                            # Add emojis and send response
-                            response_text = add_emojis_to_text(response_text)
+                            response_text = results['emoji']
                             await split_and_send_message(update, response_text)
                             
                             # Save successful interaction to memory
@@ -532,11 +498,23 @@ User's message: {message_text}"""
                             user_memory.add_message(user_id, "assistant", response_text)
                             break  # Exit retry loop on success
                             
-                        except Exception as search_error:
+                        except StageError as search_error:
+                            precomputed = {
+                                name: search_error.results[name]
+                                for name in ('language', 'search')
+                                if name in search_error.results
+                            }
+                            user_lang = precomputed.get('language', user_lang)
+                            log_event(logger, logging.INFO, "pipeline_trace", user=user_id, trace=search_error.trace.summary())
+                            if isinstance(search_error.cause, CircuitOpenError):
+                                # Retrying can't help until the breaker lets probes through
+                                await update.message.reply_text(get_error_message('ai_error', user_lang))
+                                break
                             if "Token limit exceeded" in str(search_error):
                                 # Remove oldest messages and retry
                                 user_memory.trim_context(user_id)
                                 retry_count += 1
+                                RETRIES.labels('token_limit').inc()
                                 logger.warning(f"Token limit exceeded, retrying {retry_count}/{MAX_RETRIES}")
                                 
                                 # Send periodic update about retrying
@@ -552,10 +530,15 @@ User's message: {message_text}"""
                     except Exception as context_error:
                         logger.error(f"Context retrieval error: {context_error}")
                         retry_count += 1
-                        if retry_count == MAX_RETRIES:
+                        # Only timeouts, 429s and 5xxs are worth another attempt
+                        cause = context_error.cause if isinstance(context_error, StageError) else context_error
+                        if retry_count == MAX_RETRIES or not is_dependency_failure(cause):
                             error_message = get_error_message('general', user_lang)
                             await update.message.reply_text(error_message)
                             break
+                        RETRIES.labels('handle_message').inc()
+                        # Stages in precomputed aren't re-run
+                        await asyncio.sleep(retry_delay(retry_count, deadline, plan.send_reserve))
                 
                 if retry_count == MAX_RETRIES:
                     logger.error("Max retries reached for token management")
@@ -569,7 +552,7 @@ User's message: {message_text}"""
             
             finally:
                 # Stop typing indicator
-                typing_task.cancel()
+                chat_action.stop()
         
         # Handle media messages
         elif update.message.photo:
@@ -593,19 +576,20 @@ User's message: {message_text}"""
         error_message = get_error_message('general', user_lang)
         await update.message.reply_text(error_message)
 
-async def intelligent_web_search(user_message, model):
+async def intelligent_web_search(user_message, model, deadline=None):
     """
     Intelligently generate and perform web searches using Gemini
     
     Args:
         user_message (str): Original user message
-        model (genai.GenerativeModel): Gemini model for query generation and result processing
+        model (google.generativeai.GenerativeModel): Gemini model for query generation and result processing
+        deadline (Deadline): Budget for the whole search; page fetching is cut to fit it
     
     Returns:
-        str: Processed web search results
+        str: Ranked search passages, or a Gemini summary when SEARCH_MODE is 'summarize'
     """
     try:
-        logging.info(f"Web search başlatıldı: {user_message}")
+        log_event(logging.getLogger(), logging.INFO, "web_search_started", sampled=True, query=truncate(user_message, 80))
         
         # First, generate search queries using Gemini
         query_generation_prompt = f"""
@@ -621,13 +605,19 @@ async def intelligent_web_search(user_message, model):
         """
         
         # Use Gemini to generate search queries with timeout and retry logic
-        logging.info("Generating search queries with Gemini")
+        logging.debug("Generating search queries with Gemini")
         try:
-            query_response = await asyncio.wait_for(
-                model.generate_content_async(query_generation_prompt),
-                timeout=10.0  # 10 second timeout
-            )
-            logging.info(f"Gemini response received: {query_response.text}")
+            with track_stage('query_generation'), GEMINI_BREAKER.call(), track_gemini('query_generation'):
+                query_response = await asyncio.wait_for(
+                    model.generate_content_async(query_generation_prompt),
+                    timeout=10.0  # 10 second timeout
+                )
+            logging.debug(f"Gemini response received: {truncate(query_response.text)}")
+            search_queries = [q.strip() for q in query_response.text.split('\n') if q.strip()]
+        except CircuitOpenError:
+            # Gemini is failing, search with the user's message as is
+            logging.info("Gemini circuit open, skipping search query generation")
+            search_queries = []
         except asyncio.TimeoutError:
             logging.error("Gemini API request timed out")
             return "Üzgünüm, şu anda arama yapamıyorum. Lütfen daha sonra tekrar deneyin."
@@ -635,35 +625,44 @@ async def intelligent_web_search(user_message, model):
             logging.error(f"Error generating search queries: {str(e)}")
             return "Arama sorgularını oluştururken bir hata oluştu."
         
-        search_queries = [q.strip() for q in query_response.text.split('\n') if q.strip()]
-        
         # Fallback if no queries generated
         if not search_queries:
             search_queries = [user_message]
         
-        logging.info(f"Generated search queries: {search_queries}")
+        log_event(logging.getLogger(), logging.INFO, "search_queries_generated", sampled=True, count=len(search_queries), queries=' | '.join(search_queries))
         
         # Perform web searches
         search_results = []
+        ddgs_error = None
         try:
             from duckduckgo_search import DDGS
-            logging.info("DDGS import edildi")
+            logging.debug("DDGS import edildi")
             
             with DDGS() as ddgs:
                 for query in search_queries:
-                    logging.info(f"DuckDuckGo araması yapılıyor: {query}")
+                    logging.debug(f"DuckDuckGo araması yapılıyor: {truncate(query)}")
                     try:
-                        results = list(ddgs.text(query, max_results=3))
-                        logging.info(f"Bulunan sonuç sayısı: {len(results)}")
+                        with DDG_BREAKER.call(), track_stage('duckduckgo'):
+                            results = await asyncio.to_thread(
+                                lambda q=query: list(ddgs.text(q, max_results=3))
+                            )
+                        logging.debug(f"Bulunan sonuç sayısı: {len(results)}")
                         search_results.extend(results)
+                    except CircuitOpenError as open_error:
+                        logging.info("DuckDuckGo circuit open, skipping DuckDuckGo queries")
+                        ddgs_error = open_error
+                        break
                     except Exception as query_error:
                         logging.warning(f"Arama sorgusu hatası: {query} - {str(query_error)}")
+                        ddgs_error = query_error
         except ImportError:
             logging.error("DuckDuckGo search modülü bulunamadı.")
             return "Arama yapılamadı: Modül hatası"
         except Exception as search_error:
             logging.error(f"DuckDuckGo arama hatası: {str(search_error)}", exc_info=True)
-            
+            ddgs_error = search_error
+        
+        if not search_results and ddgs_error is not None:
             # Fallback to alternative search method
             try:
                 import requests
@@ -673,33 +672,43 @@ async def intelligent_web_search(user_message, model):
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
                     }
                     search_url = f"https://www.google.com/search?q={query}"
-                    response = requests.get(search_url, headers=headers)
+                    response = requests.get(search_url, headers=headers, timeout=GOOGLE_FALLBACK_TIMEOUT)
+                    # 429 and 5xx answers count against the breaker
+                    response.raise_for_status()
                     
-                    if response.status_code == 200:
-                        # Basic parsing, can be improved
-                        from bs4 import BeautifulSoup
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        search_results = soup.find_all('div', class_='g')
-                        
-                        parsed_results = []
-                        for result in search_results[:3]:
-                            title = result.find('h3')
-                            link = result.find('a')
-                            snippet = result.find('div', class_='VwiC3b')
-                            
-                            if title and link and snippet:
-                                parsed_results.append({
-                                    'title': title.text,
-                                    'link': link['href'],
-                                    'body': snippet.text
-                                })
+                    # Basic parsing, can be improved
+                    from bs4 import BeautifulSoup
+                    soup = BeautifulSoup(response.text, 'html.parser')
+                    search_results = soup.find_all('div', class_='g')
+                    
+                    parsed_results = []
+                    for result in search_results[:3]:
+                        title = result.find('h3')
+                        link = result.find('a')
+                        snippet = result.find('div', class_='VwiC3b')
                         
-                        return parsed_results
-                    return []
+                        if title and link and snippet:
+                            parsed_results.append({
+                                'title': title.text,
+                                'link': link['href'],
+                                'body': snippet.text
+                            })
+                    
+                    return parsed_results
                 
                 for query in search_queries:
-                    results = fallback_search(query)
-                    search_results.extend(results)
+                    try:
+                        with GOOGLE_BREAKER.call(), track_stage('google_fallback'):
+                            results = await asyncio.wait_for(
+                                asyncio.to_thread(fallback_search, query),
+                                timeout=GOOGLE_FALLBACK_TIMEOUT
+                            )
+                        search_results.extend(results)
+                    except CircuitOpenError:
+                        logging.info("Google fallback circuit open, skipping fallback search")
+                        break
+                    except Exception as query_error:
+                        logging.warning(f"Fallback arama sorgusu hatası: {query} - {str(query_error)}")
                 
                 logging.info(f"Fallback arama sonuç sayısı: {len(search_results)}")
             except Exception as fallback_error:
@@ -712,11 +721,45 @@ async def intelligent_web_search(user_message, model):
         if not search_results:
             return "Arama sonucu bulunamadı. Lütfen farklı bir şekilde sormayı deneyin."
         
+        # Overlapping queries often return the same pages
+        search_results = dedupe_results(search_results)
+        
+        # Fetch the full text of the top hits (bounded by the page-fetch deadline)
+        page_texts = {}
+        # Leave a little of the search budget for ranking the passages
+        fetch_budget = deadline.timeout(reserve=0.5) if deadline is not None else None
+        if PAGE_FETCH_ENABLED and (fetch_budget is None or fetch_budget > 0):
+            top_urls = [
+                result.get('href') or result.get('link')
+                for result in search_results[:PAGE_FETCH_MAX_PAGES]
+            ]
+            page_texts = await get_page_fetcher().fetch_many(top_urls, timeout=fetch_budget)
+            logging.debug(f"Sayfa içeriği alınan sonuç sayısı: {len(page_texts)}")
+        
+        if SEARCH_MODE != 'summarize':
+            # Rank passages locally and hand them straight to the main prompt;
+            # BM25 over a few pages takes tens of ms, so it runs off the loop
+            with track_stage('search_ranking'):
+                ranked_context, ranking_stats = await asyncio.to_thread(
+                    rank_search_results,
+                    user_message,
+                    search_results,
+                    page_texts,
+                    token_budget=SEARCH_CONTEXT_TOKEN_BUDGET,
+                    extra_query=' '.join(search_queries)
+                )
+            log_event(logging.getLogger(), logging.INFO, "search_context_built", sampled=True, mode='ranked', **ranking_stats)
+            return ranked_context
+        
         # Prepare search context
-        search_context = "\n\n".join([
-            f"Arama Sonucu {i+1}: {result.get('body', 'İçerik yok')}" 
-            for i, result in enumerate(search_results)
-        ])
+        context_parts = []
+        for i, result in enumerate(search_results):
+            part = f"Arama Sonucu {i+1}: {result.get('body', 'İçerik yok')}"
+            page_text = page_texts.get(result.get('href') or result.get('link'))
+            if page_text:
+                part += f"\nSayfa İçeriği: {page_text}"
+            context_parts.append(part)
+        search_context = "\n\n".join(context_parts)
         
         # Generate final response using Gemini
         final_response_prompt = f"""
@@ -743,7 +786,8 @@ async def intelligent_web_search(user_message, model):
         """
         
         try:
-            final_response = await model.generate_content_async(final_response_prompt)
+            with track_stage('search_summary'), GEMINI_BREAKER.call(), track_gemini('search_summary'):
+                final_response = await model.generate_content_async(final_response_prompt)
             if not final_response.candidates:
                 return "Üzgünüm, şu anda yanıt üretemiyorum. Lütfen daha sonra tekrar deneyin."
             return final_response.text
@@ -756,6 +800,10 @@ async def intelligent_web_search(user_message, model):
         return f"Web arama hatası: {str(e)}"
 
 async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with track_update('image'), UPDATE_PROFILER.profile(update, 'image'), CHAT_ACTIONS.start(context.bot, update.effective_chat.id):
+        await _handle_image(update, context)
+
+async def _handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     
     try:
@@ -771,7 +819,7 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Get user's current language settings from memory
         user_settings = user_memory.get_user_settings(user_id)
         user_lang = user_settings.get('language', 'tr')  # Default to Turkish if not set
-        logger.info(f"User language: {user_lang}")
+        logger.debug(f"User language: {user_lang}")
         
         # Check if photo exists
         if not update.message.photo:
@@ -789,21 +837,19 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Download photo
         try:
-            photo_file = await context.bot.get_file(photo.file_id)
-            photo_bytes = bytes(await photo_file.download_as_bytearray())
+            with track_stage('media_download'):
+                photo_file = await context.bot.get_file(photo.file_id)
+                photo_bytes = bytes(await photo_file.download_as_bytearray())
         except Exception as download_error:
             logger.error(f"Photo download error: {download_error}")
             await update.message.reply_text("⚠️ Görsel indirilemedi. Lütfen tekrar deneyin.")
             return
         
-        logger.info(f"Photo bytes downloaded: {len(photo_bytes)} bytes")
+        log_event(logger, logging.INFO, "photo_downloaded", user=user_id, bytes=len(photo_bytes))
         
-        # Comprehensive caption handling with extensive logging
+        # Caption handling
         caption = update.message.caption
-        logger.info(f"Original caption: {caption}")
-        
         default_prompt = get_analysis_prompt('image', None, user_lang)
-        logger.info(f"Default prompt: {default_prompt}")
         
         # Ensure caption is not None
         if caption is None:
@@ -811,13 +857,13 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Ensure caption is a string and stripped
         caption = str(caption).strip()
-        logger.info(f"Final processed caption: {caption}")
+        log_event(logger, logging.DEBUG, "caption_processed", user=user_id, caption=caption)
         
         # Create a context-aware prompt that includes language preference
         personality_context = get_time_aware_personality(
             datetime.now(), 
             user_lang,
-            user_settings.get('timezone', 'Europe/Istanbul')
+            user_memory.get_timezone(user_id)
         )
         
         if not personality_context:
@@ -848,16 +894,18 @@ Kullanıcının sorusu: {caption}"""
         
         try:
             # Prepare the message with both text and image
-            model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-            response = await model.generate_content_async([
-                analysis_prompt, 
-                {"mime_type": "image/jpeg", "data": photo_bytes}
-            ])
+            model = get_model()
+            with track_stage('generation'), GEMINI_BREAKER.call(), track_gemini('image'):
+                response = await model.generate_content_async([
+                    analysis_prompt, 
+                    {"mime_type": "image/jpeg", "data": photo_bytes}
+                ])
             
             response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
             
             # Add culturally appropriate emojis
-            response_text = add_emojis_to_text(response_text)
+            with track_stage('emoji'):
+                response_text = await asyncio.to_thread(add_emojis_to_text, response_text)
             
             # Save the interaction
             user_memory.add_message(user_id, "user", f"[Image] {caption}")
@@ -876,6 +924,10 @@ Kullanıcının sorusu: {caption}"""
         await update.message.reply_text("Üzgünüm, görseli işlerken kritik bir hata oluştu. Lütfen tekrar deneyin.")
 
 async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with track_update('video'), UPDATE_PROFILER.profile(update, 'video'), CHAT_ACTIONS.start(context.bot, update.effective_chat.id):
+        await _handle_video(update, context)
+
+async def _handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     
     try:
@@ -891,7 +943,7 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Get user's current language settings from memory
         user_settings = user_memory.get_user_settings(user_id)
         user_lang = user_settings.get('language', 'tr')  # Default to Turkish if not set
-        logger.info(f"User language: {user_lang}")
+        logger.debug(f"User language: {user_lang}")
         
         # Check if video exists
         if not update.message.video:
@@ -906,16 +958,14 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⚠️ Video bulunamadı. Lütfen tekrar deneyin.")
             return
             
-        video_file = await context.bot.get_file(video.file_id)
-        video_bytes = bytes(await video_file.download_as_bytearray())
-        logger.info(f"Video bytes downloaded: {len(video_bytes)} bytes")
+        with track_stage('media_download'):
+            video_file = await context.bot.get_file(video.file_id)
+            video_bytes = bytes(await video_file.download_as_bytearray())
+        log_event(logger, logging.INFO, "video_downloaded", user=user_id, bytes=len(video_bytes))
         
-        # Comprehensive caption handling with extensive logging
+        # Caption handling
         caption = update.message.caption
-        logger.info(f"Original caption: {caption}")
-        
         default_prompt = get_analysis_prompt('video', None, user_lang)
-        logger.info(f"Default prompt: {default_prompt}")
         
         # Ensure caption is not None
         if caption is None:
@@ -923,13 +973,13 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Ensure caption is a string and stripped
         caption = str(caption).strip()
-        logger.info(f"Final processed caption: {caption}")
+        log_event(logger, logging.DEBUG, "caption_processed", user=user_id, caption=caption)
         
         # Create a context-aware prompt that includes language preference
         personality_context = get_time_aware_personality(
             datetime.now(), 
             user_lang,
-            user_settings.get('timezone', 'Europe/Istanbul')
+            user_memory.get_timezone(user_id)
         )
         
         if not personality_context:
@@ -961,16 +1011,18 @@ Kullanıcının sorusu: {caption}"""
         
         try:
             # Prepare the message with both text and video
-            model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-            response = await model.generate_content_async([
-                analysis_prompt,
-                {"mime_type": "video/mp4", "data": video_bytes}
-            ])
+            model = get_model()
+            with track_stage('generation'), GEMINI_BREAKER.call(), track_gemini('video'):
+                response = await model.generate_content_async([
+                    analysis_prompt,
+                    {"mime_type": "video/mp4", "data": video_bytes}
+                ])
             
             response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
             
             # Add culturally appropriate emojis
-            response_text = add_emojis_to_text(response_text)
+            with track_stage('emoji'):
+                response_text = await asyncio.to_thread(add_emojis_to_text, response_text)
             
             # Save the interaction
             user_memory.add_message(user_id, "user", f"[Video] {caption}")
@@ -985,14 +1037,16 @@ Kullanıcının sorusu: {caption}"""
             if "Token limit exceeded" in str(processing_error):
                 # Remove oldest messages and retry
                 user_memory.trim_context(user_id)
+                RETRIES.labels('video_token_limit').inc()
                 try:
-                    model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
-                    response = await model.generate_content_async([
-                        analysis_prompt,
-                        {"mime_type": "video/mp4", "data": video_bytes}
-                    ])
+                    model = get_model()
+                    with GEMINI_BREAKER.call(), track_gemini('video'):
+                        response = await model.generate_content_async([
+                            analysis_prompt,
+                            {"mime_type": "video/mp4", "data": video_bytes}
+                        ])
                     response_text = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
-                    response_text = add_emojis_to_text(response_text)
+                    response_text = await asyncio.to_thread(add_emojis_to_text, response_text)
                     await update.message.reply_text(response_text)
                 except Exception as retry_error:
                     logger.error(f"Retry error: {retry_error}", exc_info=True)
@@ -1005,6 +1059,63 @@ Kullanıcının sorusu: {caption}"""
         logger.error(f"Kritik video işleme hatası: {e}", exc_info=True)
         await update.message.reply_text("⚠️ Üzgünüm, videonuzu işlerken kritik bir hata oluştu. Lütfen tekrar deneyin.")
 
+async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the user's timezone from a shared location, resolved offline"""
+    user_id = update.effective_user.id
+    location = update.effective_message.location
+    user_lang = user_memory.get_user_settings(user_id).get('language', 'en')
+    # The first lookup waits for the polygons if warm-up hasn't finished loading them
+    timezone_name = await asyncio.to_thread(timezone_at, location.latitude, location.longitude)
+    if not timezone_name:
+        await update.effective_message.reply_text(get_error_message('timezone_unknown', user_lang))
+        return
+    user_memory.set_timezone(user_id, timezone_name, 'location')
+    log_event(logger, logging.INFO, "timezone_set", user=user_id, timezone=timezone_name, source='location')
+    await update.effective_message.reply_text(get_error_message('timezone_set', user_lang).format(timezone=timezone_name))
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone [city | Area/City | lat,lon]: show or set the user's timezone"""
+    user_id = update.effective_user.id
+    user_lang = user_memory.get_user_settings(user_id).get('language', 'en')
+    if not context.args:
+        await update.effective_message.reply_text(
+            get_error_message('timezone_current', user_lang).format(timezone=user_memory.get_timezone(user_id))
+        )
+        return
+    # Coordinates go through the same polygon lookup as a shared location
+    timezone_name = await asyncio.to_thread(resolve_place, ' '.join(context.args))
+    if not timezone_name:
+        await update.effective_message.reply_text(get_error_message('timezone_unknown', user_lang))
+        return
+    user_memory.set_timezone(user_id, timezone_name, 'city')
+    log_event(logger, logging.INFO, "timezone_set", user=user_id, timezone=timezone_name, source='city')
+    await update.effective_message.reply_text(get_error_message('timezone_set', user_lang).format(timezone=timezone_name))
+
+async def generate_inline_answer(query_text):
+    """Short, standalone answer for an inline query"""
+    prompt = f"""You are Nyxie, a friendly female Protogen assistant.
+Answer the question below in at most three short sentences, in the same language as the question.
+Give the answer directly, without greetings or follow-up questions.
+
+Question: {query_text}"""
+    model = get_model(GEMINI_FAST_MODEL)
+    with GEMINI_BREAKER.call(), track_gemini('inline'):
+        response = await model.generate_content_async(
+            prompt, generation_config={'max_output_tokens': INLINE_MAX_OUTPUT_TOKENS}
+        )
+    return response.text
+
+INLINE = InlineResponder(
+    generate_inline_answer,
+    debounce=INLINE_DEBOUNCE_S,
+    deadline=INLINE_DEADLINE_S,
+    cache_ttl=INLINE_CACHE_TTL_S,
+    cache_time=INLINE_CACHE_TIME_S,
+)
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await INLINE.handle(update, context)
+
 async def handle_token_limit_error(update: Update):
     error_message = "Üzgünüm, mesaj geçmişi çok uzun olduğu için yanıt veremedim. Biraz bekleyip tekrar dener misin? 🙏"
     await update.message.reply_text(error_message)
@@ -1017,7 +1128,7 @@ def add_emojis_to_text(text):
     """Add context-relevant emojis using Gemini"""
     try:
         # Use Gemini to suggest relevant emojis
-        emoji_model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
+        emoji_model = get_model()
         
         # Prompt Gemini to suggest emojis based on text context
         emoji_prompt = f"""
@@ -1033,7 +1144,8 @@ def add_emojis_to_text(text):
         Response format: Just the emoji or empty string
         """
         
-        emoji_response = emoji_model.generate_content(emoji_prompt)
+        with GEMINI_BREAKER.call(), track_gemini('emoji'):
+            emoji_response = emoji_model.generate_content(emoji_prompt)
         suggested_emoji = emoji_response.text.strip()
         
         # If no emoji suggested, return original text
@@ -1102,18 +1214,129 @@ def get_analysis_prompt(media_type, caption, lang):
     # Fallback to default prompt
     return prompts['default'].get(lang, prompts['default']['en'])
 
+async def record_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    mark_first_update()
+
+def _log_warm_up_result(future):
+    if future.exception() is not None:
+        logger.error(f"Client warm-up failed: {future.exception()}")
+
+async def archive_idle_memories():
+    """Periodically move idle users' memory to the cold tier"""
+    while True:
+        try:
+            stats = await asyncio.to_thread(user_memory.archive_idle_users, MEMORY_ARCHIVE_AFTER_DAYS * 86400)
+            if stats["users"]:
+                log_event(logger, logging.INFO, "memory_archived", **stats)
+        except Exception as e:
+            logger.error(f"Memory archiving failed: {e}")
+        await asyncio.sleep(MEMORY_ARCHIVE_INTERVAL_S)
+
+async def post_init(application: Application):
+    """Warm up Gemini and search clients in a worker thread after startup"""
+    global _archive_task
+    GROUP_FILTER.set_bot(application.bot.id, application.bot.username)
+    future = asyncio.get_running_loop().run_in_executor(None, warm_up)
+    future.add_done_callback(_log_warm_up_result)
+    if MEMORY_ARCHIVE_INTERVAL_S > 0:
+        _archive_task = asyncio.create_task(archive_idle_memories())
+    if LOOP_WATCHDOG_ENABLED:
+        LOOP_WATCHDOG.start()
+
+async def post_shutdown(application: Application):
+    await LOOP_WATCHDOG.aclose()
+    if _archive_task is not None:
+        _archive_task.cancel()
+        await asyncio.gather(_archive_task, return_exceptions=True)
+    await CHAT_ACTIONS.aclose()
+    await close_page_fetcher()
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [n]: write cProfile dumps for the next n updates (admins only)"""
+    try:
+        count = int(context.args[0]) if context.args else 1
+    except ValueError:
+        count = 1
+    UPDATE_PROFILER.arm(min(count, 100))
+    await update.effective_message.reply_text(
+        f"Profiling the next {UPDATE_PROFILER.armed} updates into {UPDATE_PROFILER.output_dir}/"
+    )
+
+async def notify_throttled(update: Update, reason):
+    user_lang = user_memory.get_user_settings(update.effective_user.id).get('language', 'en')
+    log_event(logger, logging.INFO, "update_throttled", user=update.effective_user.id, reason=reason)
+    if update.effective_message:
+        await update.effective_message.reply_text(get_error_message('throttled', user_lang))
+
+def _skips_scheduler(update):
+    if update.inline_query is not None:
+        # Debounced and cancelled per user by INLINE; queuing would only add latency
+        return True
+    # Group chatter is dropped by the handler filters and shouldn't use the sender's quota
+    message = update.effective_message
+    if message is None or GROUP_FILTER.addressed(message):
+        return False
+    # Commands and locations reach handlers (and do work) without being addressed
+    if message.location is not None:
+        return False
+    return not any(entity.type == MessageEntity.BOT_COMMAND and entity.offset == 0 for entity in message.entities)
+
+def build_update_processor():
+    """Weighted-fair update processor: per-user cost quotas and concurrency caps"""
+    return FairScheduler(
+        max_active=int(os.getenv("SCHEDULER_MAX_ACTIVE", "32")),
+        per_user_active=int(os.getenv("SCHEDULER_PER_USER_ACTIVE", "1")),
+        max_queued_per_user=int(os.getenv("SCHEDULER_MAX_QUEUED_PER_USER", "5")),
+        quota_units=float(os.getenv("SCHEDULER_QUOTA_UNITS", "120")),
+        quota_window=float(os.getenv("SCHEDULER_QUOTA_WINDOW", "600")),
+        cost_model=CostModel(
+            photo_base=float(os.getenv("COST_PHOTO_BASE", "2")),
+            video_base=float(os.getenv("COST_VIDEO_BASE", "5")),
+            video_per_mb=float(os.getenv("COST_VIDEO_PER_MB", "1")),
+        ),
+        on_throttled=notify_throttled,
+        bypass=_skips_scheduler,
+    )
+
 def main():
+    if '--startup-report' in sys.argv:
+        print_startup_report(warm_up)
+        return
+    
+    if not os.getenv("GEMINI_API_KEY") and not os.getenv("GEMINI_API_KEYS"):
+        logger.error("GEMINI_API_KEY not found in environment variables")
+        raise ValueError("GEMINI_API_KEY environment variable is required")
+    
     # Initialize bot
-    application = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
+    with timed_phase('application_build'):
+        application = (
+            Application.builder()
+            .token(os.getenv("TELEGRAM_TOKEN"))
+            .concurrent_updates(build_update_processor())
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
+    
+    # Expose Prometheus metrics on a local endpoint
+    start_metrics_server()
+    QUEUE_DEPTH.set_function(application.update_queue.qsize)
     
     # Add handlers
-    application.add_handler(MessageHandler(filters.VIDEO, handle_video))
-    application.add_handler(MessageHandler(filters.PHOTO, handle_image))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(TypeHandler(Update, record_first_update), group=-1)
+    if ADMIN_USER_IDS:
+        application.add_handler(CommandHandler("profile", profile_command, filters=filters.User(user_id=ADMIN_USER_IDS)))
+    application.add_handler(CommandHandler("timezone", timezone_command))
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    # New messages only: a live location arrives as a stream of edited_message updates
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.LOCATION & GROUP_FILTER, handle_location))
+    application.add_handler(MessageHandler(filters.VIDEO & GROUP_FILTER, handle_video))
+    application.add_handler(MessageHandler(filters.PHOTO & GROUP_FILTER, handle_image))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & GROUP_FILTER, handle_message))
     
     # Start the bot
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
-    user_memory = UserMemory()
+    user_memory = UserMemory(archive_codec=MEMORY_ARCHIVE_CODEC)
     main()
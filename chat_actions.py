@@ -0,0 +1,177 @@
+"""
+Shared "typing…" indicator for all chats with a turn in progress.
+
+Telegram shows a chat action for about five seconds, so it has to be
+re-sent while a reply is being produced. Instead of one loop task per
+message, handlers register their turn with the ChatActionManager, which
+keeps a refcount per chat and runs a single ticker task. Each tick re-sends
+"typing" to the chats that are due, spread under a global rate limit, and a
+chat is dropped as soon as its last turn ends.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.constants import ChatAction
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CHAT_ACTIONS_SENT = REGISTRY.counter(
+    'nyxie_chat_actions_total',
+    'Chat actions sent by the shared ticker by outcome (sent, error, rate_limited)',
+    ('action', 'outcome')
+)
+CHAT_ACTION_CHATS = REGISTRY.gauge(
+    'nyxie_chat_action_active_chats',
+    'Chats with a turn in progress that get a chat action'
+)
+
+
+
+class _ChatState:
+    __slots__ = ('bot', 'turns', 'last_sent')
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.turns = 0
+        self.last_sent = 0.0
+
+
+class ChatActionHandle:
+    """One turn's claim on a chat's indicator; stop() is idempotent"""
+    __slots__ = ('manager', 'chat_id', 'active')
+
+    def __init__(self, manager, chat_id):
+        self.manager = manager
+        self.chat_id = chat_id
+        self.active = True
+
+    def stop(self):
+        if self.active:
+            self.manager._release(self.chat_id)
+            self.active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class ChatActionManager:
+    """Refcounted set of active chats served by one ticker task"""
+
+    def __init__(self, interval=4.0, max_per_second=20.0, tick=0.5):
+        self.interval = interval
+        self.max_per_second = max_per_second
+        self.tick = tick
+        self._chats = {}
+        self._task = None
+        self._wakeup = None
+        self._paused_until = 0.0
+        CHAT_ACTION_CHATS.set_function(lambda: len(self._chats))
+
+    def start(self, bot, chat_id):
+        """
+        Show "typing" in a chat until the returned handle is stopped
+
+        Args:
+            bot (telegram.Bot): Bot used to send the chat action
+            chat_id (int): Chat to show the indicator in
+
+        Returns:
+            ChatActionHandle: Call stop() (or use as a context manager) when the turn ends
+        """
+        state = self._chats.get(chat_id)
+        if state is None:
+            # New chat: send on the next tick
+            state = self._chats[chat_id] = _ChatState(bot)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        state.turns += 1
+        self._ensure_ticker()
+        return ChatActionHandle(self, chat_id)
+
+    def _release(self, chat_id):
+        state = self._chats.get(chat_id)
+        if state is None:
+            return
+        state.turns -= 1
+        if state.turns <= 0:
+            # Telegram clears the indicator on the next message, nothing to send
+            del self._chats[chat_id]
+
+    def _ensure_ticker(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._chats:
+                self._wakeup.clear()
+                await self._send_due()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.tick)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Chat action ticker failed: {e}")
+        finally:
+            self._task = None
+
+    async def _send_due(self):
+        now = time.monotonic()
+        if now < self._paused_until:
+            return
+        due = [
+            (state.last_sent, chat_id, state)
+            for chat_id, state in self._chats.items()
+            if now - state.last_sent >= self.interval
+        ]
+        if not due:
+            return
+        # Longest-waiting chats first, within this tick's share of the rate limit
+        due.sort(key=lambda item: item[0])
+        budget = max(1, int(self.max_per_second * self.tick))
+        sends = []
+        for _, chat_id, state in due[:budget]:
+            state.last_sent = now
+            sends.append(self._send(state.bot, chat_id))
+        await asyncio.gather(*sends)
+
+    async def _send(self, bot, chat_id):
+        action = ChatAction.TYPING
+        if chat_id not in self._chats:
+            # The turn ended before the send started; don't show typing after the reply
+            return
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=action)
+            CHAT_ACTIONS_SENT.labels(action, 'sent').inc()
+        except Exception as e:
+            retry_after = getattr(e, 'retry_after', None)
+            if retry_after:
+                # Flood control applies to the whole bot, back off every chat
+                retry_after = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+                self._paused_until = time.monotonic() + float(retry_after)
+                CHAT_ACTIONS_SENT.labels(action, 'rate_limited').inc()
+            else:
+                CHAT_ACTIONS_SENT.labels(action, 'error').inc()
+            logger.debug(f"Chat action {action} for {chat_id} failed: {e}")
+
+    async def aclose(self):
+        self._chats.clear()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
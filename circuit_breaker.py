@@ -0,0 +1,270 @@
+"""
+Circuit breakers for the bot's external dependencies.
+
+Each breaker tracks call outcomes over a sliding time window. When the
+failure rate in the window crosses the threshold (with enough calls to be
+meaningful) the breaker opens, and calls are rejected immediately with
+CircuitOpenError instead of waiting on a dependency that is down or
+rate-limiting us. After the open period a few probe calls are let through
+(half-open); a successful probe closes the breaker, a failed one reopens it.
+
+Calls that take longer than the slow-call threshold count as failures, so a
+degraded service that answers slowly trips the breaker like one that errors.
+Only errors that say something about the dependency's health count: timeouts,
+connection failures, 429 and 5xx. A 4xx answer means the service is up and
+rejected this particular request, so it is recorded as a completed call.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    'nyxie_circuit_state',
+    'Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)',
+    ('dependency',)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'nyxie_circuit_transitions_total',
+    'Circuit breaker state changes by new state',
+    ('dependency', 'state')
+)
+CIRCUIT_CALLS = REGISTRY.counter(
+    'nyxie_circuit_calls_total',
+    'Calls through a circuit breaker by outcome (success, failure, slow, rejected)',
+    ('dependency', 'outcome')
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name):
+        super().__init__(f"circuit '{name}' is open")
+        self.name = name
+
+
+def error_status(error):
+    """HTTP status an error carries: .code (google api_core), .status_code or .response, else a leading status"""
+    for code in (getattr(error, 'code', None), getattr(error, 'status_code', None),
+                 getattr(getattr(error, 'response', None), 'status_code', None)):
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            continue
+        if 100 <= code <= 599:
+            return code
+    head = str(error).split(' ', 1)[0]
+    return int(head) if head.isdigit() and 100 <= int(head) <= 599 else None
+
+
+def is_dependency_failure(error):
+    """Default failure predicate: timeouts, connection failures, 429 and 5xx"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Library errors that don't subclass the builtins (requests, httpx, duckduckgo_search)
+    for cls in type(error).__mro__:
+        name = cls.__name__.lower()
+        if 'timeout' in name or 'ratelimit' in name or 'connect' in name:
+            return True
+    status = error_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class _BreakerCall:
+    """Context manager guarding one call; see CircuitBreaker.call()"""
+    __slots__ = ('breaker', 'start')
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+
+    def __enter__(self):
+        self.breaker.acquire()
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.monotonic() - self.start
+        if exc_type is not None and issubclass(exc_type, CircuitOpenError):
+            # A nested breaker rejected the call, this dependency wasn't reached
+            self.breaker.release()
+        elif exc_type is None:
+            self.breaker.record(True, elapsed)
+        elif issubclass(exc_type, Exception):
+            # A client error still means the dependency answered
+            self.breaker.record(not self.breaker.is_failure(exc), elapsed)
+        elif elapsed >= self.breaker.slow_call_seconds:
+            # Cancelled by a stage timeout after waiting too long on the dependency
+            self.breaker.record(False, elapsed)
+        else:
+            self.breaker.release()
+        return False
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker with a sliding time window
+
+    Args:
+        is_failure: callable(exception) -> bool deciding which errors count
+            against the dependency; defaults to is_dependency_failure
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window=60.0,
+                 open_seconds=30.0, half_open_probes=1, slow_call_seconds=30.0,
+                 is_failure=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.slow_call_seconds = slow_call_seconds
+        self.is_failure = is_failure or is_dependency_failure
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        # (monotonic time, ok) for calls completed within the window
+        self._outcomes = deque()
+        self._failures = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(_STATE_VALUES[CLOSED])
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit '{self.name}' {self._state} -> {state}")
+        self._state = state
+        CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+
+    def _maybe_half_open(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+            self._probes_in_flight = 0
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def allow(self):
+        """Whether a call may go ahead right now, without reserving a probe slot"""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self._state == OPEN:
+                return False
+            return self._state == CLOSED or self._probes_in_flight < self.half_open_probes
+
+    def acquire(self):
+        """Reserve a call, raising CircuitOpenError if the breaker rejects it"""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return
+        CIRCUIT_CALLS.labels(self.name, 'rejected').inc()
+        raise CircuitOpenError(self.name)
+
+    def release(self):
+        """Give back a reserved call without recording an outcome"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record(self, ok, elapsed=0.0):
+        """Record the outcome of a call made after acquire()"""
+        slow = ok and elapsed >= self.slow_call_seconds
+        ok = ok and not slow
+        CIRCUIT_CALLS.labels(self.name, 'slow' if slow else 'success' if ok else 'failure').inc()
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if ok:
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._transition(CLOSED)
+                else:
+                    self._opened_at = now
+                    self._transition(OPEN)
+                return
+            if self._state == OPEN:
+                # A call that started before the breaker opened
+                return
+            self._outcomes.append((now, ok))
+            if not ok:
+                self._failures += 1
+            self._prune(now)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._opened_at = now
+                self._transition(OPEN)
+
+    def call(self):
+        """
+        Guard a block that calls the dependency
+
+        Raises CircuitOpenError on entry when the breaker is open. Exceptions
+        from the block count as failures when is_failure says so, slow calls
+        always do; cancellations only count when they happen after the
+        slow-call threshold.
+        """
+        return _BreakerCall(self)
+
+
+# Per-dependency slow-call thresholds (seconds)
+_SLOW_CALL_DEFAULTS = {
+    'gemini': 30.0,
+    'duckduckgo': 10.0,
+    'google_fallback': 8.0,
+}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def _env_float(name, dependency, default):
+    value = os.getenv(f"CIRCUIT_{dependency.upper()}_{name}") or os.getenv(f"CIRCUIT_{name}")
+    return float(value) if value else default
+
+
+def get_breaker(dependency):
+    """Shared breaker for a dependency, configured from the environment"""
+    breaker = _breakers.get(dependency)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(dependency)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    dependency,
+                    failure_rate=_env_float('FAILURE_RATE', dependency, 0.5),
+                    min_calls=int(_env_float('MIN_CALLS', dependency, 5)),
+                    window=_env_float('WINDOW', dependency, 60.0),
+                    open_seconds=_env_float('OPEN_SECONDS', dependency, 30.0),
+                    half_open_probes=int(_env_float('HALF_OPEN_PROBES', dependency, 1)),
+                    slow_call_seconds=_env_float('SLOW_CALL_SECONDS', dependency,
+                                                 _SLOW_CALL_DEFAULTS.get(dependency, 30.0)),
+                )
+                _breakers[dependency] = breaker
+    return breaker
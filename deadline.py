@@ -0,0 +1,180 @@
+"""
+Per-update reply deadline and the degradation ladder.
+
+Every text reply gets an overall time budget. Stage timeouts are clipped to
+what is left of it, and when the budget can't fit the full pipeline the
+reply steps down an ordered ladder, each rung keeping the cuts of the ones
+before it:
+
+    full > no_emoji > no_search > short_history > fast_model
+
+Whether a rung fits is judged from moving averages of observed stage
+durations, so the ladder adapts to how slow Gemini and search currently are.
+"""
+import threading
+import time
+
+from metrics import REGISTRY
+
+RUNGS = ('full', 'no_emoji', 'no_search', 'short_history', 'fast_model')
+FULL, NO_EMOJI, NO_SEARCH, SHORT_HISTORY, FAST_MODEL = range(len(RUNGS))
+
+REPLY_RUNGS = REGISTRY.counter(
+    'nyxie_reply_degradation_total',
+    'Replies by the degradation ladder rung they were produced at',
+    ('rung',)
+)
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    'nyxie_reply_deadline_exceeded_total',
+    'Updates whose reply deadline ran out before a reply was produced',
+    ('kind',)
+)
+
+
+class Deadline:
+    """Absolute deadline on the monotonic clock"""
+    __slots__ = ('budget', 'start', 'expires_at')
+
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.start = time.monotonic()
+        self.expires_at = self.start + self.budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, limit=None, reserve=0.0):
+        """Seconds a step may take: the remaining budget minus `reserve`, capped at `limit`"""
+        available = max(0.0, self.remaining() - reserve)
+        return available if limit is None else min(limit, available)
+
+
+class StageEstimates:
+    """Exponentially weighted moving averages of stage durations (seconds)"""
+
+    def __init__(self, defaults, alpha=0.2):
+        self.alpha = alpha
+        self._values = dict(defaults)
+        self._lock = threading.Lock()
+
+    def get(self, stage):
+        return self._values.get(stage, 0.0)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self._values.get(stage)
+            self._values[stage] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+# Seeds until real durations have been observed; generation is keyed by
+# the ladder variant because history size and model change its cost
+ESTIMATES = StageEstimates({
+    'language': 1.0,
+    'context': 0.05,
+    'search': 6.0,
+    'generation': 8.0,
+    'generation_short': 6.0,
+    'generation_fast': 3.0,
+    'emoji': 1.0,
+})
+
+
+def generation_key(rung):
+    if rung >= FAST_MODEL:
+        return 'generation_fast'
+    if rung >= SHORT_HISTORY:
+        return 'generation_short'
+    return 'generation'
+
+
+class DegradationPlan:
+    """
+    The ladder rung one reply runs at
+
+    The rung only moves down the ladder: it is chosen from the remaining
+    budget before each pipeline attempt, and stages escalate it further when
+    they start late.
+    """
+
+    def __init__(self, deadline, send_reserve=1.5, estimates=ESTIMATES):
+        self.deadline = deadline
+        # Time kept back for sending the reply to Telegram
+        self.send_reserve = send_reserve
+        self.estimates = estimates
+        self.rung = FULL
+
+    @property
+    def name(self):
+        return RUNGS[self.rung]
+
+    @property
+    def skip_emoji(self):
+        return self.rung >= NO_EMOJI
+
+    @property
+    def skip_search(self):
+        return self.rung >= NO_SEARCH
+
+    @property
+    def short_history(self):
+        return self.rung >= SHORT_HISTORY
+
+    @property
+    def fast_model(self):
+        return self.rung >= FAST_MODEL
+
+    def escalate(self, rung):
+        if rung > self.rung:
+            self.rung = rung
+        return self.rung
+
+    def required(self, rung, search_done=False):
+        """Estimated seconds a pipeline run at `rung` still needs"""
+        est = self.estimates.get
+        parallel = max(est('language'), est('context'))
+        if rung < NO_SEARCH and not search_done:
+            parallel = max(parallel, est('search'))
+        return parallel + est(generation_key(rung)) + self.reserve_after('generation', rung)
+
+    def reserve_after(self, stage, rung=None):
+        """Estimated seconds the stages after `stage` need, so it can't eat their budget"""
+        rung = self.rung if rung is None else rung
+        reserve = self.send_reserve
+        if stage != 'emoji' and rung < NO_EMOJI:
+            reserve += self.estimates.get('emoji')
+        if stage in ('language', 'context', 'search'):
+            reserve += self.estimates.get(generation_key(rung))
+        return reserve
+
+    def choose(self, search_done=False):
+        """Step down the ladder until the estimated cost fits the remaining budget"""
+        remaining = self.deadline.remaining()
+        rung = self.rung
+        while rung < FAST_MODEL and self.required(rung, search_done) > remaining:
+            rung += 1
+        return self.escalate(rung)
+
+    def record(self):
+        REPLY_RUNGS.labels(self.name).inc()
+
+    def observe_trace(self, trace):
+        """Feed the durations of stages that completed normally into the estimates"""
+        for name, record in trace.records.items():
+            if record.status != 'ok':
+                continue
+            # Stages the plan skipped return instantly and would skew the averages
+            if (name == 'emoji' and self.skip_emoji) or (name == 'search' and self.skip_search):
+                continue
+            key = generation_key(self.rung) if name == 'generation' else name
+            self.estimates.observe(key, record.duration)
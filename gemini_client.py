@@ -0,0 +1,138 @@
+"""
+Lazily configured Gemini client.
+
+google.generativeai is only imported and configured on first use (or from
+the background warm-up task), and models are cached instead of being
+rebuilt for every request. get_model() returns a PooledModel that spreads
+requests over every configured API key (see gemini_pool).
+"""
+import logging
+import os
+import threading
+
+from gemini_pool import KeyPool, PooledModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-2.0-flash-thinking-exp-01-21'
+
+_genai = None
+_pool = None
+_models = {}
+_lock = threading.Lock()
+
+
+def parse_api_keys(value, default_rpm=60, default_tpm=1_000_000):
+    """
+    Parse GEMINI_API_KEYS: comma-separated `key[:rpm[:tpm]]` entries
+
+    Returns:
+        list of (api_key, rpm, tpm)
+    """
+    keys = []
+    for entry in value.split(","):
+        parts = entry.strip().split(":")
+        if not parts[0]:
+            continue
+        rpm = int(parts[1]) if len(parts) > 1 and parts[1] else default_rpm
+        tpm = int(parts[2]) if len(parts) > 2 and parts[2] else default_tpm
+        keys.append((parts[0], rpm, tpm))
+    return keys
+
+
+class _KeyBoundModel:
+    """A GenerativeModel whose requests go out with one API key's clients"""
+
+    def __init__(self, model, client_manager):
+        self.model = model
+        self.client_manager = client_manager
+
+    async def generate_content_async(self, *args, **kwargs):
+        # Created on first use, like the SDK's defaults, so the async client binds to the running loop
+        if getattr(self.model, '_async_client', False) is None:
+            self.model._async_client = self.client_manager.get_default_client('generative_async')
+        return await self.model.generate_content_async(*args, **kwargs)
+
+    def generate_content(self, *args, **kwargs):
+        if getattr(self.model, '_client', False) is None:
+            self.model._client = self.client_manager.get_default_client('generative')
+        return self.model.generate_content(*args, **kwargs)
+
+
+def get_key_pool():
+    """The shared pool of Gemini API keys, from GEMINI_API_KEYS or GEMINI_API_KEY"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _lock:
+        if _pool is None:
+            keys = parse_api_keys(
+                os.getenv("GEMINI_API_KEYS") or os.getenv("GEMINI_API_KEY", ""),
+                default_rpm=int(os.getenv("GEMINI_KEY_RPM", "60")),
+                default_tpm=int(os.getenv("GEMINI_KEY_TPM", "1000000")),
+            )
+            if not keys:
+                logger.error("GEMINI_API_KEY not found in environment variables")
+                raise ValueError("GEMINI_API_KEY environment variable is required")
+            _pool = KeyPool(
+                keys,
+                cooldown=float(os.getenv("GEMINI_KEY_COOLDOWN_S", "30")),
+                forbidden_cooldown=float(os.getenv("GEMINI_KEY_FORBIDDEN_COOLDOWN_S", "600")),
+            )
+            logger.info(f"Gemini key pool has {len(keys)} key(s)")
+    return _pool
+
+
+def get_genai():
+    """Import and configure google.generativeai once"""
+    global _genai
+    if _genai is not None:
+        return _genai
+    # The default client (used by anything outside the pool) gets the first key
+    api_key = get_key_pool().keys[0].api_key
+    with _lock:
+        if _genai is None:
+            import google.generativeai as genai
+            try:
+                genai.configure(api_key=api_key)
+                logger.info("Gemini API configured successfully")
+            except Exception as e:
+                logger.error(f"Failed to configure Gemini API: {str(e)}")
+                raise
+            _genai = genai
+    return _genai
+
+
+def _bind_model(genai, model_name, key):
+    from google.generativeai.client import _ClientManager
+
+    client_manager = _ClientManager()
+    client_manager.configure(api_key=key.api_key)
+    return _KeyBoundModel(genai.GenerativeModel(model_name), client_manager)
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """Return a cached, key-pooled model for the given model name"""
+    model = _models.get(model_name)
+    if model is None:
+        genai = get_genai()
+        pool = get_key_pool()
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                model = PooledModel(pool, lambda key: _bind_model(genai, model_name, key))
+                _models[model_name] = model
+    return model
+
+
+def warm_up():
+    """Import heavy client modules, build the default model and load timezone data ahead of the first update"""
+    from startup import timed_phase
+
+    with timed_phase('gemini_init'):
+        get_model()
+    with timed_phase('search_import'):
+        import duckduckgo_search  # noqa: F401
+    with timed_phase('timezone_init'):
+        import timezones
+        timezones.warm_up()
@@ -0,0 +1,279 @@
+"""
+Pool of Gemini API keys with per-key quota tracking.
+
+Each key (usually one per Google Cloud project) has its own requests-per-
+minute and tokens-per-minute limits. The pool tracks what every key has
+used over the last minute and sends each request to the key with the most
+headroom left. A key that answers 429 (quota exhausted) or 403 (key
+disabled or not allowed) is quarantined for a cool-down and the request is
+retried on the next key; once the cool-down ends the key is used again.
+
+PooledModel stands in for a GenerativeModel, so call sites keep calling
+generate_content_async / generate_content as before.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from circuit_breaker import error_status
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+KEY_REQUESTS = REGISTRY.counter(
+    'nyxie_gemini_key_requests_total',
+    'Gemini requests per API key by outcome (ok, rate_limited, forbidden, error)',
+    ('key', 'outcome')
+)
+KEY_TOKENS = REGISTRY.counter(
+    'nyxie_gemini_key_tokens_total',
+    'Gemini tokens used per API key (reported by the API, estimated otherwise)',
+    ('key',)
+)
+KEY_QUARANTINED = REGISTRY.gauge(
+    'nyxie_gemini_key_quarantined',
+    'Whether an API key is quarantined (1) or in rotation (0)',
+    ('key',)
+)
+KEY_HEADROOM = REGISTRY.gauge(
+    'nyxie_gemini_key_headroom_ratio',
+    'Share of the per-minute quota an API key has left (the lower of RPM and TPM)',
+    ('key',)
+)
+
+# Tokens Gemini bills for one inline image; video and audio are billed by
+# duration, which isn't known here, so they get the same rough estimate
+_MEDIA_PART_TOKENS = 258
+
+
+class NoAvailableKeyError(Exception):
+    """Raised when every key in the pool is quarantined"""
+    # Counts against the Gemini breaker like the 429s that caused it
+    code = 429
+
+
+def estimate_tokens(contents):
+    """Rough prompt size in tokens, ~4 characters per token"""
+    if isinstance(contents, str):
+        return len(contents) // 4 + 1
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) if isinstance(part, str) else _MEDIA_PART_TOKENS for part in contents)
+    return _MEDIA_PART_TOKENS
+
+
+def _retry_delay(error):
+    """Server-suggested retry delay in seconds, if the error carries one"""
+    for detail in getattr(error, 'details', None) or ():
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and hasattr(delay, 'seconds'):
+            return delay.seconds + getattr(delay, 'nanos', 0) / 1e9
+    return None
+
+
+class ApiKey:
+    """One key's limits, sliding one-minute usage and quarantine state"""
+
+    def __init__(self, label, api_key, rpm, tpm):
+        self.label = label
+        self.api_key = api_key
+        self.rpm = rpm
+        self.tpm = tpm
+        # (monotonic time, requests, tokens) recorded in the last minute
+        self.usage = deque()
+        self.requests = 0
+        self.tokens = 0
+        self.quarantined_until = 0.0
+        # When the latest quarantine began; failures of requests sent before it belong to that burst
+        self.quarantined_at = 0.0
+        self.strikes = 0
+        KEY_QUARANTINED.labels(label).set(0)
+
+    def prune(self, now):
+        cutoff = now - 60.0
+        while self.usage and self.usage[0][0] < cutoff:
+            _, requests, tokens = self.usage.popleft()
+            self.requests -= requests
+            self.tokens -= tokens
+
+    def headroom(self):
+        rpm_left = 1.0 - self.requests / self.rpm if self.rpm else 1.0
+        tpm_left = 1.0 - self.tokens / self.tpm if self.tpm else 1.0
+        return min(rpm_left, tpm_left)
+
+
+class KeyPool:
+    """
+    Balances Gemini requests over API keys by remaining per-minute quota
+
+    Args:
+        keys (list of (api_key, rpm, tpm)): Keys with their per-minute limits (0 = unlimited)
+        cooldown (float): Quarantine after a 429 without a server retry delay, doubled per repeat
+        forbidden_cooldown (float): Quarantine after a 403
+        max_cooldown (float): Upper bound on a quarantine
+    """
+
+    def __init__(self, keys, cooldown=30.0, forbidden_cooldown=600.0, max_cooldown=900.0):
+        if not keys:
+            raise ValueError("At least one Gemini API key is required")
+        self.keys = [ApiKey(f"key{i}", api_key, rpm, tpm) for i, (api_key, rpm, tpm) in enumerate(keys)]
+        self.cooldown = cooldown
+        self.forbidden_cooldown = forbidden_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        for key in self.keys:
+            KEY_HEADROOM.labels(key.label).set_function(lambda key=key: self._headroom(key))
+
+    def _headroom(self, key):
+        with self._lock:
+            key.prune(time.monotonic())
+            return key.headroom()
+
+    def acquire(self, tokens, exclude=()):
+        """Reserve a request of about `tokens` on the key with the most headroom"""
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            best_headroom = None
+            for key in self.keys:
+                if key in exclude:
+                    continue
+                if key.quarantined_until:
+                    if now < key.quarantined_until:
+                        continue
+                    key.quarantined_until = 0.0
+                    KEY_QUARANTINED.labels(key.label).set(0)
+                    logger.info(f"Gemini {key.label} back in rotation")
+                key.prune(now)
+                # Ties (e.g. unlimited keys) go to the key with fewer recent requests
+                headroom = (key.headroom(), -key.requests)
+                if best is None or headroom > best_headroom:
+                    best, best_headroom = key, headroom
+            if best is None:
+                raise NoAvailableKeyError("all Gemini API keys are quarantined")
+            best.usage.append((now, 1, tokens))
+            best.requests += 1
+            best.tokens += tokens
+        return best
+
+    def settle(self, key, estimated, actual):
+        """Replace a request's estimated tokens with what the API reported"""
+        KEY_TOKENS.labels(key.label).inc(actual)
+        if actual == estimated:
+            return
+        delta = actual - estimated
+        with self._lock:
+            # A correction entry: expires like the request, without counting as one
+            key.usage.append((time.monotonic(), 0, delta))
+            key.tokens += delta
+
+    def succeeded(self, key):
+        with self._lock:
+            key.strikes = 0
+        KEY_REQUESTS.labels(key.label, 'ok').inc()
+
+    def failed(self, key, error, started=None):
+        """
+        Record a failed request; returns True if the key was quarantined and another may be tried
+
+        Args:
+            started (float): monotonic time the request was sent; a request sent
+                before the key's latest quarantine doesn't extend it
+        """
+        status = error_status(error)
+        if status == 429:
+            outcome = 'rate_limited'
+        elif status == 403:
+            outcome = 'forbidden'
+        else:
+            KEY_REQUESTS.labels(key.label, 'error').inc()
+            return False
+        KEY_REQUESTS.labels(key.label, outcome).inc()
+        with self._lock:
+            now = time.monotonic()
+            if key.quarantined_until > now or (started is not None and started < key.quarantined_at):
+                # Another request in the same burst already quarantined the key
+                return True
+            if status == 429:
+                key.strikes += 1
+                delay = _retry_delay(error) or self.cooldown * 2 ** (key.strikes - 1)
+            else:
+                delay = self.forbidden_cooldown
+            delay = min(delay, self.max_cooldown)
+            key.quarantined_at = now
+            key.quarantined_until = now + delay
+        KEY_QUARANTINED.labels(key.label).set(1)
+        logger.warning(f"Gemini {key.label} quarantined for {delay:.0f}s after {status}")
+        return True
+
+
+def _usage_tokens(response):
+    usage = getattr(response, 'usage_metadata', None)
+    total = getattr(usage, 'total_token_count', None)
+    return total if isinstance(total, int) and total > 0 else None
+
+
+class PooledModel:
+    """
+    GenerativeModel facade that runs every request on a key from the pool
+
+    Args:
+        pool (KeyPool): Keys to balance over
+        model_factory: callable(ApiKey) -> GenerativeModel-like object bound to that key
+    """
+
+    def __init__(self, pool, model_factory):
+        self.pool = pool
+        self._factory = model_factory
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model_for(self, key):
+        model = self._models.get(key.label)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key.label)
+                if model is None:
+                    model = self._models[key.label] = self._factory(key)
+        return model
+
+    def _retry_on_next_key(self, key, estimated, error, tried, started):
+        # Rejected requests don't use tokens; the request still counts towards RPM
+        self.pool.settle(key, estimated, 0)
+        if not self.pool.failed(key, error, started) or len(tried) + 1 >= len(self.pool.keys):
+            return False
+        tried.append(key)
+        return True
+
+    def _succeeded(self, key, estimated, response):
+        self.pool.settle(key, estimated, _usage_tokens(response) or estimated)
+        self.pool.succeeded(key)
+        return response
+
+    async def generate_content_async(self, contents, *args, **kwargs):
+        estimated = estimate_tokens(contents)
+        tried = []
+        while True:
+            key = self.pool.acquire(estimated, exclude=tried)
+            started = time.monotonic()
+            try:
+                response = await self._model_for(key).generate_content_async(contents, *args, **kwargs)
+            except Exception as e:
+                if self._retry_on_next_key(key, estimated, e, tried, started):
+                    continue
+                raise
+            return self._succeeded(key, estimated, response)
+
+    def generate_content(self, contents, *args, **kwargs):
+        estimated = estimate_tokens(contents)
+        tried = []
+        while True:
+            key = self.pool.acquire(estimated, exclude=tried)
+            started = time.monotonic()
+            try:
+                response = self._model_for(key).generate_content(contents, *args, **kwargs)
+            except Exception as e:
+                if self._retry_on_next_key(key, estimated, e, tried, started):
+                    continue
+                raise
+            return self._succeeded(key, estimated, response)
@@ -0,0 +1,131 @@
+"""
+Cheap routing for group chats.
+
+In a group the bot only answers messages addressed to it: an @mention, a
+reply to one of its own messages, or one of the configured trigger words.
+Everything else is rejected by a handler filter, before language detection,
+search, generation or a memory write happen. The check only looks at fields
+already on the parsed Message and runs one precompiled regex, so ignoring
+chatter costs next to nothing.
+
+Addressed messages are additionally capped per group with a token bucket,
+so one busy group can't take over the bot.
+"""
+import re
+import time
+
+from telegram.constants import ChatType, MessageEntityType
+from telegram.ext import filters
+
+from metrics import REGISTRY
+
+GROUP_SKIPPED = REGISTRY.counter(
+    'nyxie_group_messages_skipped_total',
+    'Group messages ignored before any processing (not_addressed, rate_limited)',
+    ('reason',)
+)
+GROUP_ADDRESSED = REGISTRY.counter(
+    'nyxie_group_messages_addressed_total',
+    'Group messages addressed to the bot and let through'
+)
+
+_GROUP_TYPES = frozenset((ChatType.GROUP, ChatType.SUPERGROUP))
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class GroupAddressFilter(filters.MessageFilter):
+    """
+    Passes private messages, and group messages that address the bot within the group's rate cap
+
+    Args:
+        trigger_words (iterable of str): Words that address the bot without a mention (case-insensitive)
+        rate_per_minute (float): Addressed messages a group may send per minute (0 disables the cap)
+        burst (int): Addressed messages a group may send back to back
+        max_groups (int): Tracked groups before idle buckets are swept
+    """
+
+    def __init__(self, trigger_words=(), rate_per_minute=6.0, burst=3, max_groups=4096):
+        super().__init__(name='GroupAddressFilter')
+        self.trigger_words = tuple(w.strip() for w in trigger_words if w.strip())
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.max_groups = max_groups
+        self.bot_id = None
+        self._pattern = None
+        self._buckets = {}
+        self._compile(None)
+
+    def set_bot(self, bot_id, username):
+        """Called once the bot's identity is known (after Application.initialize)"""
+        self.bot_id = bot_id
+        self._compile(username)
+
+    def _compile(self, username):
+        alternatives = [re.escape(word) for word in self.trigger_words]
+        if username:
+            alternatives.append('@' + re.escape(username))
+        # Word boundaries on both sides so "nyxie" doesn't match inside "nyxies" or an email
+        self._pattern = re.compile(
+            r'(?<!\w)(?:' + '|'.join(alternatives) + r')(?!\w)', re.IGNORECASE
+        ) if alternatives else None
+
+    def addressed(self, message):
+        """Whether a message is for the bot; private chats always are. Has no side effects."""
+        chat = message.chat
+        if chat is None or chat.type not in _GROUP_TYPES:
+            return True
+        reply = message.reply_to_message
+        if reply is not None and reply.from_user is not None and reply.from_user.id == self.bot_id:
+            return True
+        text = message.text or message.caption
+        if text and self._pattern is not None and self._pattern.search(text):
+            return True
+        # Mentions of a bot without a username arrive as text_mention entities
+        for entity in message.entities or message.caption_entities:
+            if entity.type == MessageEntityType.TEXT_MENTION and entity.user and entity.user.id == self.bot_id:
+                return True
+        return False
+
+    def _take(self, chat_id):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_groups:
+                self._sweep(now)
+            bucket = self._buckets[chat_id] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens < 1.0:
+            return False
+        bucket.tokens -= 1.0
+        return True
+
+    def _sweep(self, now):
+        # A bucket that would have refilled by now carries no state
+        refill = self.burst / self.rate
+        self._buckets = {
+            chat_id: bucket for chat_id, bucket in self._buckets.items()
+            if now - bucket.updated < refill
+        }
+
+    def filter(self, message):
+        if message.chat is None or message.chat.type not in _GROUP_TYPES:
+            return True
+        if not self.addressed(message):
+            GROUP_SKIPPED.labels('not_addressed').inc()
+            return False
+        if not self._take(message.chat.id):
+            GROUP_SKIPPED.labels('rate_limited').inc()
+            return False
+        GROUP_ADDRESSED.inc()
+        return True
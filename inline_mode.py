@@ -0,0 +1,199 @@
+"""
+Inline query answers (`@bot question` from any chat).
+
+Telegram sends a new inline query on nearly every keystroke and expects an
+answer within a second or two, so this path is built for latency rather
+than depth:
+
+- queries are normalized and answered from a shared TTL cache first;
+  answers are marked non-personal so Telegram can cache them for everyone
+  via cache_time as well
+- a cache miss waits out a short per-user debounce; if the user typed
+  again meanwhile the older query is dropped, and a generation that is
+  already running for a superseded query is cancelled
+- generation uses a fast model under a strict deadline, without search,
+  history or emoji steps
+
+Latency and outcomes are recorded separately from the chat path.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INLINE_QUERIES = REGISTRY.counter(
+    'nyxie_inline_queries_total',
+    'Inline queries by outcome (cache_hit, generated, superseded, timeout, error, too_short, expired)',
+    ('outcome',)
+)
+INLINE_LATENCY = REGISTRY.histogram(
+    'nyxie_inline_answer_seconds',
+    'Time from receiving an inline query to answering it',
+    ('outcome',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+)
+INLINE_CACHE_SIZE = REGISTRY.gauge(
+    'nyxie_inline_cache_entries',
+    'Answers in the shared inline query cache'
+)
+
+_PUNCTUATION_EDGES = re.compile(r'^[\W_]+|[\W_]+$')
+
+
+def normalize_query(text):
+    """Cache key for a query: casefolded, single-spaced, without leading/trailing punctuation"""
+    return _PUNCTUATION_EDGES.sub('', ' '.join(text.casefold().split()))
+
+
+class InlineResponder:
+    """
+    Answers inline queries from a shared cache or a fast, deadline-bound generation
+
+    Args:
+        generate: async callable(query_text) -> answer text
+        debounce (float): Seconds to wait for the user to stop typing before generating
+        deadline (float): Seconds a generation may take before the query is answered empty
+        cache_ttl (float): Seconds an answer stays in the shared cache
+        cache_size (int): Answers kept in the shared cache
+        cache_time (int): cache_time sent to Telegram with each answer
+        min_length (int): Shorter normalized queries are ignored
+    """
+
+    def __init__(self, generate, debounce=0.4, deadline=2.0, cache_ttl=600.0,
+                 cache_size=2048, cache_time=300, min_length=3):
+        self.generate = generate
+        self.debounce = debounce
+        self.deadline = deadline
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_time = cache_time
+        self.min_length = min_length
+        # normalized query -> (expires_at, answer), oldest first
+        self._cache = OrderedDict()
+        # user id -> sequence number of their latest query
+        self._latest = {}
+        # user id -> generation task for their latest query
+        self._inflight = {}
+        self._seq = itertools.count()
+        INLINE_CACHE_SIZE.set_function(lambda: len(self._cache))
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _cache_put(self, key, answer):
+        self._cache[key] = (time.monotonic() + self.cache_ttl, answer)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _record(self, outcome, start):
+        INLINE_QUERIES.labels(outcome).inc()
+        INLINE_LATENCY.labels(outcome).observe(time.monotonic() - start)
+
+    async def handle(self, update, context):
+        start = time.monotonic()
+        inline_query = update.inline_query
+        key = normalize_query(inline_query.query)
+        if len(key) < self.min_length:
+            INLINE_QUERIES.labels('too_short').inc()
+            return
+
+        answer = self._cache_get(key)
+        if answer is not None:
+            await self._answer(inline_query, key, answer, start, 'cache_hit')
+            return
+
+        user_id = inline_query.from_user.id
+        seq = next(self._seq)
+        self._latest[user_id] = seq
+        previous = self._inflight.pop(user_id, None)
+        if previous is not None:
+            # The user kept typing; that answer would never be shown
+            previous.cancel()
+
+        await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) != seq:
+            self._record('superseded', start)
+            return
+        # Another user may have asked the same thing while we waited
+        answer = self._cache_get(key)
+        if answer is not None:
+            self._forget(user_id, seq)
+            await self._answer(inline_query, key, answer, start, 'cache_hit')
+            return
+
+        task = asyncio.get_running_loop().create_task(self.generate(inline_query.query.strip()))
+        self._inflight[user_id] = task
+        try:
+            answer = await asyncio.wait_for(task, timeout=self.deadline)
+        except asyncio.CancelledError:
+            # A newer query from this user cancelled the generation; anything
+            # else (e.g. shutdown cancelling this handler) propagates
+            if task.cancelled() and self._latest.get(user_id) != seq:
+                self._record('superseded', start)
+                return
+            raise
+        except asyncio.TimeoutError:
+            self._record('timeout', start)
+            await self._answer_empty(inline_query)
+            return
+        except Exception as e:
+            logger.warning(f"Inline answer failed: {e}")
+            self._record('error', start)
+            await self._answer_empty(inline_query)
+            return
+        finally:
+            if self._inflight.get(user_id) is task:
+                del self._inflight[user_id]
+            self._forget(user_id, seq)
+
+        answer = (answer or '').strip()
+        if not answer:
+            self._record('error', start)
+            await self._answer_empty(inline_query)
+            return
+        self._cache_put(key, answer)
+        await self._answer(inline_query, key, answer, start, 'generated')
+
+    def _forget(self, user_id, seq):
+        if self._latest.get(user_id) == seq:
+            del self._latest[user_id]
+
+    async def _answer(self, inline_query, key, answer, start, outcome):
+        question = inline_query.query.strip()
+        result = InlineQueryResultArticle(
+            id=hashlib.md5(key.encode('utf-8')).hexdigest(),
+            title=question[:64],
+            description=answer[:160],
+            input_message_content=InputTextMessageContent(f"❓ {question}\n\n{answer}"[:4096]),
+        )
+        try:
+            await inline_query.answer([result], cache_time=self.cache_time, is_personal=False)
+        except Exception as e:
+            # Usually "query is too old": the user moved on before we answered
+            logger.debug(f"Could not answer inline query: {e}")
+            self._record('expired', start)
+            return
+        self._record(outcome, start)
+
+    async def _answer_empty(self, inline_query):
+        try:
+            await inline_query.answer([], cache_time=0, is_personal=True)
+        except Exception as e:
+            logger.debug(f"Could not answer inline query: {e}")
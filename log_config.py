@@ -0,0 +1,118 @@
+"""
+Non-blocking logging setup for Nyxie.
+
+Handlers on the event loop thread format each record and enqueue it;
+QueueHandler.prepare() formats on the thread that logs, so only the
+(rotating) file and stream I/O moves to a background QueueListener thread.
+Keeping messages short (truncate, format_fields) is what keeps the
+formatting cheap.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Maximum characters kept for any single structured field value
+MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "200"))
+# Fraction of high-volume (sampled) lines that are actually emitted
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+_listener = None
+
+
+def truncate(value, max_length=None):
+    """Shorten a value for logging, keeping a marker with the original length"""
+    if max_length is None:
+        max_length = MAX_FIELD_LENGTH
+    text = str(value)
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}…(+{len(text) - max_length} chars)"
+
+
+def format_fields(**fields):
+    """Render key=value pairs with truncated, single-line values"""
+    parts = []
+    for key, value in fields.items():
+        text = truncate(value).replace('\n', '\\n')
+        if ' ' in text or not text:
+            text = '"' + text.replace('"', '\\"') + '"'
+        parts.append(f"{key}={text}")
+    return ' '.join(parts)
+
+
+def log_event(logger, level, event, sampled=False, **fields):
+    """
+    Log a structured event line
+
+    Args:
+        logger (logging.Logger): Logger to write to
+        level (int): Logging level
+        event (str): Short event name
+        sampled (bool): Subject this line to LOG_SAMPLE_RATE
+        **fields: Extra key=value fields, truncated to MAX_FIELD_LENGTH
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sampled and LOG_SAMPLE_RATE < 1.0 and random.random() >= LOG_SAMPLE_RATE:
+        return
+    if fields:
+        logger.log(level, f"{event} {format_fields(**fields)}")
+    else:
+        logger.log(level, event)
+
+
+def setup_logging(log_file='bot_logs.log', level=logging.INFO):
+    """
+    Route all logging through a queue drained by a background thread
+
+    Args:
+        log_file (str): Path of the rotating log file
+        level (int): Root logging level
+
+    Returns:
+        logging.handlers.QueueListener: The started listener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,106 @@
+"""
+Event-loop lag watchdog.
+
+A heartbeat task sleeps for a short interval and records how late it wakes
+up; that scheduling delay is how long the loop was busy with something
+else. Blocking calls inside async handlers (synchronous HTTP, Gemini or
+file I/O) show up as large lags, but by the time the heartbeat runs again
+the culprit has returned. So a watcher thread also checks the heartbeat,
+and when it is overdue by more than the threshold it captures the loop
+thread's current stack, which is the frame that is blocking it.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.histogram(
+    'nyxie_event_loop_lag_seconds',
+    'How late the event loop heartbeat woke up',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LOOP_STALLS = REGISTRY.counter(
+    'nyxie_event_loop_stalls_total',
+    'Times the event loop was blocked for longer than the watchdog threshold'
+)
+
+
+class LoopWatchdog:
+    """
+    Measures event-loop scheduling delay and reports the stack of blocking code
+
+    Args:
+        interval (float): Heartbeat period in seconds
+        threshold (float): Lag in seconds after which the loop counts as stalled
+        max_frames (int): Innermost frames of the blocking stack to log
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, max_frames=25):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_frames = max_frames
+        self._last_beat = 0.0
+        self._beats = 0
+        self._reported_beat = -1
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the heartbeat and watcher; call from the event loop thread"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                logger.warning(f"Event loop stall ended after {lag * 1000:.0f} ms")
+            self._last_beat = time.monotonic()
+            self._beats += 1
+
+    def _watch(self):
+        # Check a few times per threshold so stalls are caught close to it
+        period = min(self.interval, self.threshold / 2)
+        while not self._stop.wait(period):
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue < self.threshold or self._reported_beat == self._beats:
+                continue
+            # One report per stall: the heartbeat counter moves on once the loop is free
+            self._reported_beat = self._beats
+            LOOP_STALLS.inc()
+            self._report(overdue)
+
+    def _report(self, overdue):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = ''.join(traceback.format_stack(frame)[-self.max_frames:])
+        logger.warning(f"Event loop blocked for {overdue * 1000:.0f} ms so far, loop thread stack:\n{stack}")
+
+    async def aclose(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
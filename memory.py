@@ -0,0 +1,324 @@
+"""
+Per-user conversation memory persisted as JSON files
+
+Active users live in the hot tier, one indented JSON file each under
+`memory_dir`. Users idle past a threshold are moved by archive_idle_users()
+to the cold tier: minified JSON, gzip (or zstd) compressed, under
+`memory_dir/archive`. A cold user is rehydrated into the hot tier
+transparently the next time their memory is loaded; an archive that can't
+be read is renamed to `*.corrupt` and kept for recovery.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from message_log import MessageLog
+from metrics import CACHE_HITS, CACHE_MISSES, REGISTRY, TOKEN_TRIMS, track_stage
+from timezones import DEFAULT_TIMEZONE, loadable_timezone
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TIER_MOVES = REGISTRY.counter(
+    'nyxie_memory_tier_moves_total',
+    'User memories moved between storage tiers (archived, rehydrated, quarantined)',
+    ('direction',)
+)
+MEMORY_ARCHIVE_BYTES = REGISTRY.counter(
+    'nyxie_memory_archive_bytes_total',
+    'Bytes of user memory archived, as hot JSON before and compressed after',
+    ('form',)
+)
+
+_ARCHIVE_SUFFIXES = {'gzip': '.json.gz', 'zstd': '.json.zst'}
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, suffix):
+    if suffix == _ARCHIVE_SUFFIXES['zstd']:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .json.zst archives")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class UserMemory:
+    def __init__(self, memory_dir="user_memories", archive_codec="gzip"):
+        self.users = {}
+        self.memory_dir = memory_dir
+        self.archive_dir = Path(memory_dir) / "archive"
+        self.max_tokens = 2097152
+        if archive_codec == 'zstd' and zstandard is None:
+            logger.warning("zstandard is not installed, archiving user memory with gzip")
+            archive_codec = 'gzip'
+        self.archive_codec = archive_codec
+        # Wall-clock time each user was last loaded or saved, so the archiver skips them
+        self._touched = {}
+        # Serializes file access between the event loop and the archiver thread
+        self._lock = threading.RLock()
+        # Ensure memory directory exists on initialization
+        Path(self.memory_dir).mkdir(parents=True, exist_ok=True)
+        
+    def get_user_settings(self, user_id):
+        user_id = str(user_id)
+        # Under the lock so the archiver can't evict the user between the check and the read
+        with self._lock:
+            if user_id not in self.users:
+                CACHE_MISSES.labels('user_memory').inc()
+                self.load_user_memory(user_id)
+            else:
+                CACHE_HITS.labels('user_memory').inc()
+            return self.users[user_id]
+        
+    def update_user_settings(self, user_id, settings_dict):
+        user_id = str(user_id)
+        with self._lock:
+            if user_id not in self.users:
+                self.load_user_memory(user_id)
+            self.users[user_id].update(settings_dict)
+            self.save_user_memory(user_id)
+
+    def get_timezone(self, user_id):
+        """The user's timezone from preferences, or the default if the local tzdata can't load it"""
+        preferences = self.get_user_settings(user_id).get("preferences") or {}
+        name = preferences.get("timezone")
+        return (loadable_timezone(name) if isinstance(name, str) else None) or DEFAULT_TIMEZONE
+
+    def set_timezone(self, user_id, timezone_name, source):
+        """Persist a resolved timezone and how it was set ('location', 'city')"""
+        with self._lock:
+            settings = self.get_user_settings(user_id)
+            preferences = settings.setdefault("preferences", {})
+            preferences["timezone"] = timezone_name
+            preferences["timezone_source"] = source
+            self.save_user_memory(user_id)
+
+    def ensure_memory_directory(self):
+        Path(self.memory_dir).mkdir(parents=True, exist_ok=True)
+
+    def get_user_file_path(self, user_id):
+        return Path(self.memory_dir) / f"user_{user_id}.json"
+
+    def get_archive_paths(self, user_id):
+        return [self.archive_dir / f"user_{user_id}{suffix}" for suffix in _ARCHIVE_SUFFIXES.values()]
+
+    def load_user_memory(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._touched[user_id] = time.time()
+            self._load_user_memory(user_id)
+
+    def _load_user_memory(self, user_id):
+        user_file = self.get_user_file_path(user_id)
+        try:
+            if user_file.exists():
+                with track_stage('memory_load'):
+                    with open(user_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    data["messages"] = MessageLog.from_json_list(data.get("messages"))
+                    self.users[user_id] = data
+            elif self._rehydrate(user_id):
+                pass
+            else:
+                self.users[user_id] = {
+                    "messages": MessageLog(),
+                    "language": "tr",
+                    "current_topic": None,
+                    "total_tokens": 0,
+                    "preferences": {
+                        "custom_language": None,
+                        "timezone": DEFAULT_TIMEZONE
+                    }
+                }
+                self.save_user_memory(user_id)
+        except Exception as e:
+            logger.error(f"Error loading memory for user {user_id}: {e}")
+            self.users[user_id] = {
+                "messages": MessageLog(),
+                "language": "tr",
+                "current_topic": None,
+                "total_tokens": 0,
+                "preferences": {
+                    "custom_language": None,
+                    "timezone": DEFAULT_TIMEZONE
+                }
+            }
+            self.save_user_memory(user_id)
+
+    def save_user_memory(self, user_id):
+        user_id = str(user_id)
+        user_file = self.get_user_file_path(user_id)
+        try:
+            self.ensure_memory_directory()
+            with self._lock, track_stage('memory_save'):
+                self._touched[user_id] = time.time()
+                data = dict(self.users[user_id])
+                data["messages"] = data["messages"].to_json_list()
+                with open(user_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving memory for user {user_id}: {e}")
+
+    def _rehydrate(self, user_id):
+        """Load a user from the cold tier and move them back to the hot tier"""
+        for archive_file in self.get_archive_paths(user_id):
+            if not archive_file.exists():
+                continue
+            with track_stage('memory_rehydrate'):
+                try:
+                    raw = _decompress(archive_file.read_bytes(), ''.join(archive_file.suffixes))
+                    data = json.loads(raw)
+                    data["messages"] = MessageLog.from_json_list(data.get("messages"))
+                except Exception as e:
+                    self._quarantine_archive(user_id, archive_file, e)
+                    continue
+                self.users[user_id] = data
+                self.save_user_memory(user_id)
+            # Only drop the archive once the hot copy is on disk
+            if self.get_user_file_path(user_id).exists():
+                archive_file.unlink()
+            MEMORY_TIER_MOVES.labels('rehydrated').inc()
+            return True
+        return False
+
+    def _quarantine_archive(self, user_id, archive_file, error):
+        """Move an unreadable archive aside so it is neither loaded nor overwritten by the next archive run"""
+        corrupt_file = archive_file.with_name(f"{archive_file.name}.{int(time.time())}.corrupt")
+        try:
+            os.replace(archive_file, corrupt_file)
+        except OSError as e:
+            logger.error(f"Could not quarantine archived memory {archive_file} for user {user_id}: {e}")
+            raise error
+        MEMORY_TIER_MOVES.labels('quarantined').inc()
+        logger.error(f"Archived memory for user {user_id} is unreadable ({error}), moved to {corrupt_file}")
+
+    def archive_idle_users(self, idle_seconds):
+        """
+        Move users idle for at least `idle_seconds` to the compressed cold tier
+
+        Blocking file I/O; run it in a worker thread. Each user is archived
+        under the memory lock, so a user who becomes active mid-run is
+        either skipped or rehydrated on their next load.
+
+        Returns:
+            dict: users archived, hot bytes before and compressed bytes after
+        """
+        stats = {"users": 0, "hot_bytes": 0, "archived_bytes": 0}
+        cutoff = time.time() - idle_seconds
+        try:
+            entries = [
+                entry for entry in os.scandir(self.memory_dir)
+                if entry.name.startswith("user_") and entry.name.endswith(".json")
+                and entry.is_file() and entry.stat().st_mtime < cutoff
+            ]
+        except OSError as e:
+            logger.error(f"Error scanning {self.memory_dir} for idle users: {e}")
+            return stats
+        if entries:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+        for entry in entries:
+            user_id = entry.name[len("user_"):-len(".json")]
+            try:
+                moved = self._archive_user(user_id, cutoff)
+            except Exception as e:
+                logger.error(f"Error archiving memory for user {user_id}: {e}")
+                continue
+            if moved:
+                stats["users"] += 1
+                stats["hot_bytes"] += moved[0]
+                stats["archived_bytes"] += moved[1]
+        return stats
+
+    def _archive_user(self, user_id, cutoff):
+        with self._lock:
+            user_file = self.get_user_file_path(user_id)
+            # Re-check under the lock: the user may have been loaded or saved since the scan
+            if self._touched.get(user_id, 0.0) >= cutoff:
+                return None
+            try:
+                if user_file.stat().st_mtime >= cutoff:
+                    return None
+            except FileNotFoundError:
+                return None
+            hot = user_file.read_bytes()
+            minified = json.dumps(json.loads(hot), ensure_ascii=False, separators=(',', ':'))
+            compressed = _compress(minified.encode('utf-8'), self.archive_codec)
+            suffix = _ARCHIVE_SUFFIXES[self.archive_codec]
+            archive_file = self.archive_dir / f"user_{user_id}{suffix}"
+            tmp_file = archive_file.with_name(archive_file.name + ".tmp")
+            tmp_file.write_bytes(compressed)
+            os.replace(tmp_file, archive_file)
+            # An archive in the other codec would shadow this one on load
+            for stale in self.get_archive_paths(user_id):
+                if stale != archive_file and stale.exists():
+                    stale.unlink()
+            user_file.unlink()
+            self.users.pop(user_id, None)
+            self._touched.pop(user_id, None)
+        MEMORY_TIER_MOVES.labels('archived').inc()
+        MEMORY_ARCHIVE_BYTES.labels('hot').inc(len(hot))
+        MEMORY_ARCHIVE_BYTES.labels('compressed').inc(len(compressed))
+        return len(hot), len(compressed)
+
+    def add_message(self, user_id, role, content):
+        user_id = str(user_id)
+        
+        # Normalize role for consistency
+        normalized_role = "user" if role == "user" else "model"
+        
+        with self._lock:
+            # Load user's memory if not already loaded
+            if user_id not in self.users:
+                self.load_user_memory(user_id)
+            messages = self.users[user_id]["messages"]
+            
+            # Remove oldest messages if token limit exceeded (the log keeps a running total)
+            while messages.total_tokens > self.max_tokens and messages:
+                messages.pop_oldest()
+                TOKEN_TRIMS.labels('max_tokens').inc()
+            self.users[user_id]["total_tokens"] = messages.total_tokens
+            
+            # Rough token estimation is the word count
+            messages.append(normalized_role, content, datetime.now(), len(content.split()))
+            self.save_user_memory(user_id)
+
+    def get_relevant_context(self, user_id, max_messages=10):
+        """Get relevant conversation context for the user"""
+        user_id = str(user_id)
+        with self._lock:
+            if user_id not in self.users:
+                self.load_user_memory(user_id)
+            # Get the last N messages
+            recent_messages = self.users[user_id]["messages"].recent(max_messages)
+        
+        # Format messages into a string
+        context = "\n".join([
+            f"{'User' if role == 'user' else 'Assistant'}: {content}"
+            for role, content in recent_messages
+        ])
+        
+        return context
+
+    def trim_context(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            if user_id not in self.users:
+                self.load_user_memory(user_id)
+            
+            if self.users[user_id]["messages"]:
+                self.users[user_id]["messages"].pop_oldest()
+                TOKEN_TRIMS.labels('token_limit_error').inc()
+                self.save_user_memory(user_id)
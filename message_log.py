@@ -0,0 +1,185 @@
+"""
+Compact, columnar storage for a user's conversation history.
+
+Instead of one dict per message (four keys, an ISO-8601 string and a role
+string each), a MessageLog keeps parallel arrays of timestamps, role flags
+and token counts, with the content string as the only per-message object.
+It converts losslessly to and from the JSON list format used on disk;
+the only exception is entries that aren't JSON objects, which can't be
+messages and are dropped with a warning and a metric.
+"""
+import logging
+from array import array
+from datetime import datetime, timedelta
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DROPPED_ENTRIES = REGISTRY.counter(
+    'nyxie_message_log_dropped_entries_total',
+    'Stored history entries dropped on load because they are not JSON objects'
+)
+
+ROLE_USER = 0
+ROLE_MODEL = 1
+_ROLE_NAMES = ('user', 'model')
+_ROLE_CODES = {'user': ROLE_USER, 'model': ROLE_MODEL}
+
+# Timestamps are microseconds since the naive epoch, so naive local ISO
+# strings (what datetime.now().isoformat() produces) round-trip exactly
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+# Marks a message kept verbatim because it doesn't fit the compact columns
+_IRREGULAR = -(1 << 63)
+_MESSAGE_KEYS = frozenset(('role', 'content', 'timestamp', 'tokens'))
+
+
+def _to_micros(dt):
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value):
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class MessageLog:
+    """Columnar list of messages; oldest messages are dropped from the front"""
+    __slots__ = ('_timestamps', '_roles', '_tokens', '_contents', '_irregular', '_start', '_total_tokens')
+
+    def __init__(self):
+        self._timestamps = array('q')
+        self._roles = bytearray()
+        self._tokens = array('I')
+        self._contents = []
+        # Absolute index -> original message dict for irregular entries
+        self._irregular = {}
+        # Index of the oldest live message; the front is compacted lazily
+        self._start = 0
+        self._total_tokens = 0
+
+    def __len__(self):
+        return len(self._contents) - self._start
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def total_tokens(self):
+        return self._total_tokens
+
+    def append(self, role, content, timestamp=None, tokens=None):
+        """
+        Append a message
+
+        Args:
+            role (str): 'user' or 'model'
+            content (str): Message text
+            timestamp (datetime): Naive local time, defaults to now
+            tokens (int): Token estimate, defaults to the word count
+        """
+        if tokens is None:
+            tokens = len(content.split())
+        self._timestamps.append(_to_micros(timestamp or datetime.now()))
+        self._roles.append(_ROLE_CODES[role])
+        self._tokens.append(tokens)
+        self._contents.append(content)
+        self._total_tokens += tokens
+
+    def _append_raw(self, message):
+        index = len(self._contents)
+        tokens = message.get('tokens', 0)
+        if not isinstance(tokens, int) or isinstance(tokens, bool) or tokens < 0:
+            tokens = 0
+        # Clipped to the column's range once, so pop_oldest subtracts what was added
+        tokens = min(tokens, 0xFFFFFFFF)
+        self._timestamps.append(_IRREGULAR)
+        self._roles.append(ROLE_USER if message.get('role') == 'user' else ROLE_MODEL)
+        self._tokens.append(tokens)
+        self._contents.append(message.get('content', ''))
+        self._irregular[index] = message
+        self._total_tokens += tokens
+
+    def pop_oldest(self):
+        """Remove the oldest message and return it in JSON form"""
+        if not self:
+            raise IndexError("pop from empty MessageLog")
+        index = self._start
+        message = self._message_at(index)
+        self._total_tokens -= self._tokens[index]
+        self._irregular.pop(index, None)
+        self._contents[index] = None
+        self._start += 1
+        if self._start >= 1024 and self._start * 2 >= len(self._contents):
+            self._compact()
+        return message
+
+    def _compact(self):
+        start = self._start
+        del self._timestamps[:start]
+        del self._roles[:start]
+        del self._tokens[:start]
+        del self._contents[:start]
+        self._irregular = {index - start: message for index, message in self._irregular.items()}
+        self._start = 0
+
+    def recent(self, count):
+        """Return (role, content) pairs for the last `count` messages"""
+        begin = max(self._start, len(self._contents) - count) if count > 0 else len(self._contents)
+        roles = self._roles
+        contents = self._contents
+        return [(_ROLE_NAMES[roles[i]], contents[i]) for i in range(begin, len(contents))]
+
+    def _message_at(self, index):
+        raw = self._irregular.get(index)
+        if raw is not None:
+            return raw
+        return {
+            "role": _ROLE_NAMES[self._roles[index]],
+            "content": self._contents[index],
+            "timestamp": _from_micros(self._timestamps[index]).isoformat(),
+            "tokens": self._tokens[index],
+        }
+
+    def __iter__(self):
+        for index in range(self._start, len(self._contents)):
+            yield self._message_at(index)
+
+    def to_json_list(self):
+        """Messages in the on-disk format: role, content, timestamp, tokens"""
+        return list(self)
+
+    @classmethod
+    def from_json_list(cls, messages):
+        """Build a log from the on-disk format; unusual entries are kept verbatim"""
+        log = cls()
+        dropped = 0
+        for message in messages or ():
+            if not isinstance(message, dict):
+                dropped += 1
+                continue
+            role = message.get('role')
+            content = message.get('content')
+            timestamp = message.get('timestamp')
+            tokens = message.get('tokens')
+            if (
+                message.keys() == _MESSAGE_KEYS
+                and role in _ROLE_CODES
+                and isinstance(content, str)
+                and isinstance(tokens, int)
+                and not isinstance(tokens, bool)
+                and 0 <= tokens <= 0xFFFFFFFF
+                and isinstance(timestamp, str)
+            ):
+                try:
+                    dt = datetime.fromisoformat(timestamp)
+                except ValueError:
+                    dt = None
+                if dt is not None and dt.tzinfo is None and dt.isoformat() == timestamp:
+                    log.append(role, content, dt, tokens)
+                    continue
+            log._append_raw(message)
+        if dropped:
+            DROPPED_ENTRIES.inc(dropped)
+            logger.warning(f"Dropped {dropped} stored history entries that are not JSON objects")
+        return log
@@ -0,0 +1,38 @@
+"""Helpers for preparing outgoing Telegram messages"""
+
+
+def split_message_text(text, max_length=4096):
+    """
+    Split text into Telegram-sized chunks on line boundaries
+
+    Args:
+        text (str): Text to split
+        max_length (int): Maximum characters per chunk
+
+    Returns:
+        list: Non-empty chunks in order
+    """
+    messages = []
+    current_message = ""
+    
+    # Mesajı satır satır böl
+    lines = text.split('\n')
+    
+    for line in lines:
+        if not line:  # Boş satır kontrolü
+            continue
+            
+        # Eğer mevcut satır eklenince maksimum uzunluğu aşacaksa
+        if len(current_message + line + '\n') > max_length:
+            # Mevcut mesajı listeye ekle ve yeni mesaj başlat
+            if current_message.strip():  # Boş mesaj kontrolü
+                messages.append(current_message.strip())
+            current_message = line + '\n'
+        else:
+            current_message += line + '\n'
+    
+    # Son mesajı ekle
+    if current_message.strip():  # Boş mesaj kontrolü
+        messages.append(current_message.strip())
+    
+    return messages
@@ -0,0 +1,428 @@
+"""
+Lightweight in-process metrics for Nyxie.
+
+Counters, gauges and histograms are kept in plain Python objects and rendered
+in the Prometheus text exposition format on a small local HTTP endpoint.
+Everything here is stdlib only so the hot path stays a dict lookup, a lock
+and an addition.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, tuned for network calls from ~5ms to ~1min
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape_label_value(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class holding one child per label-value combination"""
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues, **labelkwargs):
+        """Return the child metric for the given label values"""
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _default_child(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        """Yield (suffix, labelvalues, extra_labels, value) samples"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labelvalues, extra, value in self.collect():
+            labels = _format_labels(self.labelnames, labelvalues, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def collect(self):
+        for key, child in list(self._children.items()):
+            yield '_total' if not self.name.endswith('_total') else '', key, None, child.value
+
+
+class _GaugeChild:
+    __slots__ = ('value', '_lock', '_function')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        """Read the gauge value from a callable at scrape time"""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception as e:
+                logger.debug(f"Gauge callback failed: {e}")
+                return float('nan')
+        return self.value
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. in-flight requests"""
+    metric_type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child().dec(amount)
+
+    def set_function(self, function):
+        self._default_child().set_function(function)
+
+    def track_inprogress(self):
+        return self._default_child().track_inprogress()
+
+    def collect(self):
+        for key, child in list(self._children.items()):
+            yield '', key, None, child.get()
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'bucket_counts', 'sum', 'count', '_lock')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values (latencies in seconds)"""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def collect(self):
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.bucket_counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.upper_bounds + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield '_sum', key, None, total
+            yield '_count', key, None, count
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, metric_class):
+                    raise ValueError(f"Metric {name} already registered as {existing.metric_type}")
+                return existing
+            metric = metric_class(name, documentation, labelnames, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Render all metrics in Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Pipeline metrics shared by the bot handlers
+STAGE_LATENCY = REGISTRY.histogram(
+    'nyxie_stage_duration_seconds',
+    'Wall-clock duration of each message pipeline stage',
+    ('stage',)
+)
+GEMINI_LATENCY = REGISTRY.histogram(
+    'nyxie_gemini_request_duration_seconds',
+    'Duration of Gemini API calls per task',
+    ('task',)
+)
+UPDATE_LATENCY = REGISTRY.histogram(
+    'nyxie_update_duration_seconds',
+    'End-to-end handling time of a Telegram update',
+    ('kind',)
+)
+UPDATES_TOTAL = REGISTRY.counter(
+    'nyxie_updates_total',
+    'Telegram updates handled',
+    ('kind',)
+)
+RETRIES = REGISTRY.counter(
+    'nyxie_retries_total',
+    'Retried operations',
+    ('operation',)
+)
+TOKEN_TRIMS = REGISTRY.counter(
+    'nyxie_token_trims_total',
+    'Conversation history trims caused by token limits',
+    ('source',)
+)
+CACHE_HITS = REGISTRY.counter(
+    'nyxie_cache_hits_total',
+    'Cache hits',
+    ('cache',)
+)
+CACHE_MISSES = REGISTRY.counter(
+    'nyxie_cache_misses_total',
+    'Cache misses',
+    ('cache',)
+)
+ERRORS = REGISTRY.counter(
+    'nyxie_errors_total',
+    'Errors raised while handling updates',
+    ('stage',)
+)
+IN_FLIGHT = REGISTRY.gauge(
+    'nyxie_updates_in_flight',
+    'Updates currently being processed',
+    ('kind',)
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    'nyxie_update_queue_depth',
+    'Telegram updates waiting in the application queue'
+)
+
+
+class _Timer:
+    """Context manager timing a block into a histogram child, counting errors"""
+    __slots__ = ('histogram', 'error_counter', 'start')
+
+    def __init__(self, histogram, error_counter=None):
+        self.histogram = histogram
+        self.error_counter = error_counter
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        if exc_type is not None and self.error_counter is not None:
+            self.error_counter.inc()
+        return False
+
+
+def track_stage(stage):
+    """Time a pipeline stage and count it as an error if it raises"""
+    return _Timer(STAGE_LATENCY.labels(stage), ERRORS.labels(stage))
+
+
+def track_gemini(task):
+    """Time a Gemini call for the given task"""
+    return _Timer(GEMINI_LATENCY.labels(task), ERRORS.labels(f"gemini_{task}"))
+
+
+@contextmanager
+def track_update(kind):
+    """Track in-flight count and end-to-end latency of one update"""
+    UPDATES_TOTAL.labels(kind).inc()
+    gauge = IN_FLIGHT.labels(kind)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge.dec()
+        UPDATE_LATENCY.labels(kind).observe(time.perf_counter() - start)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent, keep them out of the bot logs
+        pass
+
+
+def start_metrics_server(port=None, host=None, registry=REGISTRY):
+    """
+    Start the Prometheus endpoint in a daemon thread
+
+    Args:
+        port (int): Port to listen on, defaults to METRICS_PORT (0 disables)
+        host (str): Interface to bind, defaults to METRICS_HOST or 127.0.0.1
+
+    Returns:
+        ThreadingHTTPServer or None if disabled or the port is unavailable
+    """
+    if port is None:
+        port = int(os.getenv("METRICS_PORT", "9464"))
+    if host is None:
+        host = os.getenv("METRICS_HOST", "127.0.0.1")
+    if not port:
+        logger.info("Metrics endpoint disabled")
+        return None
+
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,425 @@
+"""
+Fetch, extract and cache the main text of web pages found by the search.
+
+Pages are fetched concurrently through one pooled httpx.AsyncClient with a
+per-fetch timeout, a byte cap on the body and a deadline for the whole
+stage. Extracted text is cached per URL with a TTL; stale entries that have
+an ETag or Last-Modified are revalidated with a conditional request.
+
+Search results are untrusted URLs. Connections are opened by a network
+backend that resolves the host itself, refuses loopback, private,
+link-local and reserved addresses, and dials the address it checked, so a
+host can't pass the check and then resolve somewhere else (DNS rebinding).
+Redirects are followed by hand, each hop going through the same backend.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import re
+import socket
+import time
+from collections import OrderedDict
+from html import unescape
+from html.parser import HTMLParser
+
+from metrics import CACHE_HITS, CACHE_MISSES, REGISTRY, track_stage
+
+logger = logging.getLogger(__name__)
+
+PAGE_FETCHES = REGISTRY.counter(
+    'nyxie_page_fetches_total',
+    'Page fetches by outcome (ok, not_modified, truncated, timeout, error, skipped, blocked)',
+    ('outcome',)
+)
+
+USER_AGENT = 'Mozilla/5.0 (compatible; NyxieBot/1.0; +https://t.me/)'
+
+# Tags whose text is never part of the article
+_SKIP_TAGS = {'script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form', 'svg', 'iframe', 'button', 'template'}
+# Tags that end a line of text
+_BLOCK_TAGS = {'p', 'div', 'br', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'tr', 'section', 'article', 'main'}
+_MAIN_REGION = re.compile(r'<(article|main)\b[^>]*>(.*?)</\1\s*>', re.IGNORECASE | re.DOTALL)
+_WHITESPACE = re.compile(r'[ \t\r\f\v]+')
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class BlockedURLError(Exception):
+    """Raised when a URL or one of its redirects points at a non-public address"""
+
+
+def _is_public_address(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    if ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_reserved or ip.is_multicast or ip.is_unspecified:
+        return False
+    # Also excludes shared (carrier-grade NAT) space, which is_private doesn't cover
+    return ip.is_global
+
+
+async def _resolve_public(host, port):
+    """Resolve a host, refusing it unless every address is public"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        if not _is_public_address(address):
+            raise BlockedURLError(f"{host} resolves to non-public address {address}")
+    return addresses
+
+
+class _PublicAddressBackend:
+    """
+    httpcore network backend that only connects to public addresses
+
+    The checked address is the one dialed; TLS still verifies and sends SNI
+    for the hostname, and httpx sets the Host header from the URL.
+    """
+
+    def __init__(self):
+        import httpcore
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = await _resolve_public(host, port)
+        for i, address in enumerate(addresses):
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except Exception:
+                if i == len(addresses) - 1:
+                    raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedURLError("unix sockets are not fetched")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+        self.title = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == 'title':
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or '') + data
+        elif not self.skip_depth:
+            self.parts.append(data)
+
+
+def extract_main_text(html, max_chars=3000, min_line_chars=40):
+    """
+    Extract readable article text from HTML
+
+    Fast path: when the page has an <article> or <main> element only that
+    region is parsed. Short lines (menus, buttons, bylines) are dropped.
+
+    Args:
+        html (str): Page HTML
+        max_chars (int): Maximum characters returned
+        min_line_chars (int): Lines shorter than this are treated as boilerplate
+
+    Returns:
+        str: Extracted text, possibly empty
+    """
+    region = html
+    match = _MAIN_REGION.search(html)
+    if match and len(match.group(2)) > 500:
+        region = match.group(2)
+
+    parser = _TextExtractor()
+    try:
+        parser.feed(region)
+        parser.close()
+    except Exception as e:
+        logger.debug(f"HTML parse error: {e}")
+
+    lines = []
+    total = 0
+    for line in ''.join(parser.parts).split('\n'):
+        line = _WHITESPACE.sub(' ', unescape(line)).strip()
+        if len(line) < min_line_chars:
+            continue
+        lines.append(line)
+        total += len(line) + 1
+        if total >= max_chars:
+            break
+    return '\n'.join(lines)[:max_chars]
+
+
+class CachedPage:
+    __slots__ = ('text', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, text, etag, last_modified, expires_at):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+class PageCache:
+    """LRU cache of extracted page text keyed by URL"""
+
+    def __init__(self, max_entries=512, ttl=3600, negative_ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def put(self, url, text, etag=None, last_modified=None, ttl=None):
+        entry = CachedPage(text, etag, last_modified, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def refresh(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            entry.expires_at = time.monotonic() + self.ttl
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PageFetcher:
+    """Concurrent page fetcher with a shared connection pool and text cache"""
+
+    def __init__(self, cache=None, fetch_timeout=4.0, max_bytes=512 * 1024,
+                 stage_deadline=6.0, max_chars=3000, max_connections=20, client=None,
+                 max_redirects=5, allow_private=False):
+        self.cache = cache or PageCache()
+        self.fetch_timeout = fetch_timeout
+        self.max_bytes = max_bytes
+        self.stage_deadline = stage_deadline
+        self.max_chars = max_chars
+        self.max_connections = max_connections
+        self.max_redirects = max_redirects
+        # Only for local fixtures (benchmarks, load simulator)
+        self.allow_private = allow_private
+        self._client = client
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections // 2
+            )
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+            if not self.allow_private:
+                import httpcore
+                # httpx doesn't take a network backend, so the transport gets its own pool
+                transport._pool = httpcore.AsyncConnectionPool(
+                    ssl_context=httpx.create_ssl_context(),
+                    max_connections=limits.max_connections,
+                    max_keepalive_connections=limits.max_keepalive_connections,
+                    keepalive_expiry=limits.keepalive_expiry,
+                    network_backend=_PublicAddressBackend(),
+                )
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.fetch_timeout),
+                transport=transport,
+                # Followed in _open, one checked connection per hop
+                follow_redirects=False,
+                # A proxy from the environment would connect on our behalf, unchecked
+                trust_env=False,
+                headers={'User-Agent': USER_AGENT, 'Accept': 'text/html,text/plain;q=0.9'},
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, url):
+        """
+        Return extracted text for a URL, from cache when fresh
+
+        Returns:
+            str: Extracted text, empty if the page could not be used
+        """
+        entry = self.cache.get(url)
+        if entry is not None and entry.expires_at > time.monotonic():
+            CACHE_HITS.labels('page').inc()
+            return entry.text
+        CACHE_MISSES.labels('page').inc()
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        try:
+            return await asyncio.wait_for(self._fetch(url, headers, entry), timeout=self.fetch_timeout)
+        except asyncio.TimeoutError:
+            PAGE_FETCHES.labels('timeout').inc()
+            logger.debug(f"Page fetch timed out: {url}")
+        except BlockedURLError as e:
+            PAGE_FETCHES.labels('blocked').inc()
+            logger.info(f"Page fetch blocked: {url} - {e}")
+            self.cache.put(url, '')
+            return ''
+        except Exception as e:
+            PAGE_FETCHES.labels('error').inc()
+            logger.debug(f"Page fetch failed: {url} - {e}")
+        if entry is not None:
+            # Serve stale text rather than nothing
+            return entry.text
+        # Remember the failure briefly so a slow site doesn't cost every request
+        self.cache.put(url, '', ttl=self.cache.negative_ttl)
+        return ''
+
+    async def _open(self, url, headers):
+        """Send a streaming GET, following redirects only to public addresses"""
+        import httpx
+        client = self._get_client()
+        url = httpx.URL(url)
+        for _ in range(self.max_redirects + 1):
+            if url.scheme not in ('http', 'https') or not url.host:
+                raise BlockedURLError(f"unsupported URL: {url}")
+            request = client.build_request('GET', url, headers=headers)
+            response = await client.send(request, stream=True)
+            location = response.headers.get('location')
+            if response.status_code not in _REDIRECT_STATUSES or not location:
+                return response
+            await response.aclose()
+            url = response.url.join(location)
+            # Validators belong to the original URL
+            headers = {}
+        raise httpx.TooManyRedirects(f"more than {self.max_redirects} redirects", request=request)
+
+    async def _fetch(self, url, headers, entry):
+        response = await self._open(url, headers)
+        try:
+            if response.status_code == 304 and entry is not None:
+                PAGE_FETCHES.labels('not_modified').inc()
+                self.cache.refresh(url)
+                return entry.text
+            if response.status_code != 200:
+                PAGE_FETCHES.labels('error').inc()
+                self.cache.put(url, '', ttl=self.cache.negative_ttl)
+                return ''
+            content_type = response.headers.get('content-type', '')
+            if content_type and 'html' not in content_type and 'text/plain' not in content_type:
+                PAGE_FETCHES.labels('skipped').inc()
+                self.cache.put(url, '')
+                return ''
+
+            chunks = []
+            size = 0
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_bytes:
+                    truncated = True
+                    break
+            body = b''.join(chunks)[:self.max_bytes]
+            html = body.decode(response.encoding or 'utf-8', errors='replace')
+            etag = response.headers.get('etag')
+            last_modified = response.headers.get('last-modified')
+
+        finally:
+            await response.aclose()
+
+        if 'text/plain' in content_type:
+            text = _WHITESPACE.sub(' ', html).strip()[:self.max_chars]
+        else:
+            # Parsing a few hundred KB of HTML takes tens of ms, keep it off the loop
+            text = await asyncio.to_thread(extract_main_text, html, self.max_chars)
+        PAGE_FETCHES.labels('truncated' if truncated else 'ok').inc()
+        self.cache.put(url, text, etag, last_modified)
+        return text
+
+    async def fetch_many(self, urls, timeout=None):
+        """
+        Fetch several URLs concurrently within the stage deadline
+
+        Args:
+            urls (list): URLs to fetch
+            timeout (float): Tighter deadline for this call, e.g. what is left of the reply budget
+
+        Returns:
+            dict: url -> extracted text, only for pages that produced text
+        """
+        urls = list(dict.fromkeys(u for u in urls if u and u.startswith(('http://', 'https://'))))
+        if not urls:
+            return {}
+        with track_stage('page_fetch'):
+            tasks = {asyncio.create_task(self.fetch(url)): url for url in urls}
+            deadline = self.stage_deadline if timeout is None else min(self.stage_deadline, timeout)
+            done, pending = await asyncio.wait(tasks, timeout=deadline)
+            for task in pending:
+                task.cancel()
+                PAGE_FETCHES.labels('timeout').inc()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        pages = {}
+        for task in done:
+            if not task.cancelled() and task.exception() is None and task.result():
+                pages[tasks[task]] = task.result()
+        return pages
+
+
+_fetcher = None
+
+
+def get_page_fetcher():
+    """Shared fetcher configured from the environment"""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = PageFetcher(
+            cache=PageCache(
+                max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "512")),
+                ttl=float(os.getenv("PAGE_CACHE_TTL", "3600")),
+                negative_ttl=float(os.getenv("PAGE_CACHE_NEGATIVE_TTL", "300")),
+            ),
+            fetch_timeout=float(os.getenv("PAGE_FETCH_TIMEOUT", "4")),
+            max_bytes=int(os.getenv("PAGE_FETCH_MAX_BYTES", str(512 * 1024))),
+            stage_deadline=float(os.getenv("PAGE_FETCH_DEADLINE", "6")),
+            max_chars=int(os.getenv("PAGE_TEXT_MAX_CHARS", "3000")),
+            max_redirects=int(os.getenv("PAGE_FETCH_MAX_REDIRECTS", "5")),
+            allow_private=os.getenv("PAGE_FETCH_ALLOW_PRIVATE", "0") == "1",
+        )
+    return _fetcher
+
+
+async def close_page_fetcher():
+    global _fetcher
+    if _fetcher is not None:
+        await _fetcher.aclose()
+        _fetcher = None
@@ -0,0 +1,229 @@
+"""
+Small async dependency-graph scheduler for message pipelines.
+
+Each stage is an async callable that receives the results of the stages it
+depends on. Stages start as soon as their dependencies finish, so
+independent stages run concurrently and the wall-clock time approaches the
+longest dependency chain. Every stage has its own timeout and an optional
+fallback value used when it times out or fails.
+"""
+import asyncio
+import logging
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STAGE_OUTCOMES = REGISTRY.counter(
+    'nyxie_pipeline_stage_outcomes_total',
+    'Pipeline stage results by status (ok, timeout, error, skipped)',
+    ('pipeline', 'stage', 'status')
+)
+CRITICAL_PATH_SECONDS = REGISTRY.histogram(
+    'nyxie_pipeline_critical_path_seconds',
+    'Duration of the critical path of a pipeline run',
+    ('pipeline',)
+)
+
+_NO_FALLBACK = object()
+
+
+class StageError(Exception):
+    """A stage without a fallback failed; carries the partial results and trace"""
+
+    def __init__(self, stage, cause, results, trace):
+        super().__init__(f"{stage}: {cause}")
+        self.stage = stage
+        self.cause = cause
+        self.results = results
+        self.trace = trace
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), timeout=None, fallback=_NO_FALLBACK):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+    @property
+    def has_fallback(self):
+        return self.fallback is not _NO_FALLBACK
+
+    def fallback_value(self, results):
+        return self.fallback(results) if callable(self.fallback) else self.fallback
+
+    def timeout_value(self, results):
+        return self.timeout(results) if callable(self.timeout) else self.timeout
+
+
+class StageRecord:
+    __slots__ = ('name', 'deps', 'status', 'start', 'end', 'error')
+
+    def __init__(self, name, deps):
+        self.name = name
+        self.deps = deps
+        self.status = 'pending'
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class PipelineTrace:
+    """Timing of one pipeline run, offsets are seconds from the run start"""
+
+    def __init__(self, name, records, total):
+        self.name = name
+        self.records = records
+        self.total = total
+
+    def critical_path(self):
+        """Stages on the longest chain, following the latest-finishing dependency"""
+        finished = {name: r for name, r in self.records.items() if r.end is not None}
+        if not finished:
+            return []
+        current = max(finished.values(), key=lambda r: r.end)
+        path = [current]
+        while True:
+            deps = [finished[d] for d in current.deps if d in finished]
+            if not deps:
+                break
+            current = max(deps, key=lambda r: r.end)
+            path.append(current)
+        return list(reversed(path))
+
+    def summary(self):
+        path = ' > '.join(
+            f"{r.name}({r.start * 1000:.0f}-{r.end * 1000:.0f}ms)" for r in self.critical_path()
+        )
+        stages = ' '.join(
+            f"{r.name}:{r.status}:{r.duration * 1000:.0f}ms" for r in self.records.values()
+        )
+        return f"total={self.total * 1000:.0f}ms critical_path=[{path}] stages=[{stages}]"
+
+
+class StageGraph:
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+
+    def add(self, name, func, deps=(), timeout=None, fallback=_NO_FALLBACK):
+        """
+        Register a stage; dependencies must already be registered
+
+        Args:
+            name (str): Stage name, also the key of its result
+            func (callable): async func(results) -> value
+            deps (tuple): Names of stages whose results func needs
+            timeout (float): Seconds before the stage is abandoned, or
+                callable(results) evaluated when the stage starts
+            fallback: Value, or callable(results), used on timeout/error
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage {name} already registered")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {', '.join(missing)}")
+        self.stages[name] = Stage(name, func, deps, timeout, fallback)
+        return self
+
+    async def run(self, initial=None):
+        """
+        Run all stages not already present in `initial`
+
+        Returns:
+            tuple: (results dict, PipelineTrace)
+
+        Raises:
+            StageError: If a stage without a fallback fails
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        results = dict(initial or {})
+        records = {}
+        futures = {}
+        for name in self.stages:
+            futures[name] = loop.create_future()
+            if name in results:
+                futures[name].set_result(results[name])
+
+        tasks = [
+            asyncio.create_task(self._run_stage(stage, futures, results, records, started))
+            for name, stage in self.stages.items()
+            if name not in results
+        ]
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        trace = PipelineTrace(self.name, records, time.perf_counter() - started)
+        CRITICAL_PATH_SECONDS.labels(self.name).observe(
+            sum(r.duration for r in trace.critical_path())
+        )
+
+        for outcome in outcomes:
+            if isinstance(outcome, _RootFailure):
+                raise StageError(outcome.stage, outcome.cause, results, trace) from outcome.cause
+            if isinstance(outcome, BaseException) and not isinstance(outcome, _DependencyFailed):
+                raise outcome
+        return results, trace
+
+    async def _run_stage(self, stage, futures, results, records, started):
+        record = records[stage.name] = StageRecord(stage.name, stage.deps)
+        future = futures[stage.name]
+        try:
+            for dep in stage.deps:
+                try:
+                    await futures[dep]
+                except BaseException:
+                    record.status = 'skipped'
+                    raise _DependencyFailed(dep)
+
+            record.start = time.perf_counter() - started
+            try:
+                value = await asyncio.wait_for(stage.func(results), timeout=stage.timeout_value(results))
+                record.status = 'ok'
+            except asyncio.TimeoutError as e:
+                record.status = 'timeout'
+                value = self._fallback(stage, results, record, e)
+            except Exception as e:
+                record.status = 'error'
+                value = self._fallback(stage, results, record, e)
+            finally:
+                record.end = time.perf_counter() - started
+
+            results[stage.name] = value
+            future.set_result(value)
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Dependents retrieve it; mark retrieved so leaf stages don't warn
+                future.exception()
+            raise
+        finally:
+            STAGE_OUTCOMES.labels(self.name, stage.name, record.status).inc()
+
+    def _fallback(self, stage, results, record, error):
+        record.error = repr(error)
+        if not stage.has_fallback:
+            raise _RootFailure(stage.name, error)
+        logger.warning(f"Pipeline {self.name} stage {stage.name} {record.status}, using fallback: {error!r}")
+        return stage.fallback_value(results)
+
+
+class _DependencyFailed(Exception):
+    def __init__(self, dep):
+        super().__init__(f"dependency {dep} failed")
+        self.dep = dep
+
+
+class _RootFailure(Exception):
+    def __init__(self, stage, cause):
+        super().__init__(f"{stage}: {cause}")
+        self.stage = stage
+        self.cause = cause
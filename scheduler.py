@@ -0,0 +1,295 @@
+"""
+Cost-weighted fair admission of updates.
+
+Every update gets a cost estimate from its kind and size: a text message
+costs about one unit, a photo a few and a long video tens. The scheduler is
+a python-telegram-bot update processor, so it sees every update before any
+handler runs, and admits them with start-time fair queuing: each user's
+queued updates get virtual start tags spaced by their cost, and the update
+with the smallest tag goes next. A user who just sent a burst of videos
+therefore waits behind interactive text users instead of in front of them.
+
+On top of that each user has a concurrency cap, a bound on queued updates
+and a cost quota over a sliding window; updates over the quota or queue
+bound are dropped and the user is told (at most once per notice interval).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SCHED_ADMITTED = REGISTRY.counter(
+    'nyxie_scheduler_admitted_total',
+    'Updates admitted by the fair scheduler',
+    ('user_class', 'kind')
+)
+SCHED_THROTTLED = REGISTRY.counter(
+    'nyxie_scheduler_throttled_total',
+    'Updates dropped by the fair scheduler (quota, queue_full)',
+    ('user_class', 'reason')
+)
+SCHED_WAIT = REGISTRY.histogram(
+    'nyxie_scheduler_wait_seconds',
+    'Time updates spent queued before admission',
+    ('user_class', 'kind')
+)
+SCHED_COST = REGISTRY.counter(
+    'nyxie_scheduler_cost_units_total',
+    'Estimated cost units admitted',
+    ('user_class',)
+)
+SCHED_QUEUED = REGISTRY.gauge(
+    'nyxie_scheduler_queued_updates',
+    'Updates waiting for admission'
+)
+SCHED_ACTIVE = REGISTRY.gauge(
+    'nyxie_scheduler_active_updates',
+    'Admitted updates currently being handled'
+)
+
+_MB = 1024 * 1024
+
+
+class CostModel:
+    """
+    Rough relative cost of an update in download bytes, memory and Gemini tokens
+
+    Text scales with message length (prompt tokens); photos and videos pay a
+    base cost plus their download size, and videos also their duration
+    (Gemini bills video by the second).
+    """
+
+    def __init__(self, text_base=1.0, text_chars_per_unit=2000, photo_base=2.0, photo_per_mb=1.0,
+                 video_base=5.0, video_per_mb=1.0, video_per_second=0.1, other=0.5):
+        self.text_base = text_base
+        self.text_chars_per_unit = text_chars_per_unit
+        self.photo_base = photo_base
+        self.photo_per_mb = photo_per_mb
+        self.video_base = video_base
+        self.video_per_mb = video_per_mb
+        self.video_per_second = video_per_second
+        self.other = other
+
+    def estimate(self, update):
+        """Return (kind, cost units) for an update"""
+        message = getattr(update, 'effective_message', None)
+        if message is None:
+            return 'other', self.other
+        if getattr(message, 'video', None):
+            video = message.video
+            return 'video', (
+                self.video_base
+                + (video.file_size or 0) / _MB * self.video_per_mb
+                + (video.duration or 0) * self.video_per_second
+            )
+        if getattr(message, 'photo', None):
+            largest = max(message.photo, key=lambda p: p.file_size or 0)
+            return 'photo', self.photo_base + (largest.file_size or 0) / _MB * self.photo_per_mb
+        if getattr(message, 'text', None):
+            return 'text', self.text_base + len(message.text) / self.text_chars_per_unit
+        return 'other', self.other
+
+
+class _UserState:
+    __slots__ = ('finish', 'active', 'queued', 'usage', 'usage_total', 'notified_at')
+
+    def __init__(self):
+        self.finish = 0.0
+        self.active = 0
+        self.queued = 0
+        # (monotonic time, cost) of queued and admitted updates within the quota window
+        self.usage = deque()
+        self.usage_total = 0.0
+        self.notified_at = 0.0
+
+    @property
+    def idle(self):
+        return not self.active and not self.queued and not self.usage
+
+
+class _Entry:
+    __slots__ = ('start', 'seq', 'user', 'future', 'cancelled')
+
+    def __init__(self, start, seq, user, future):
+        self.start = start
+        self.seq = seq
+        self.user = user
+        self.future = future
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.start, self.seq) < (other.start, other.seq)
+
+
+class FairScheduler(BaseUpdateProcessor):
+    """
+    Weighted-fair update processor
+
+    Args:
+        max_active (int): Updates handled at the same time across all users
+        per_user_active (int): Updates handled at the same time for one user
+        max_queued_per_user (int): Updates a user may have waiting
+        quota_units (float): Cost units a user may spend per quota window (0 disables)
+        quota_window (float): Quota window in seconds
+        heavy_fraction (float): Share of the quota above which a user counts as 'heavy'
+        cost_model (CostModel): Cost estimator
+        on_throttled: Optional async callback(update, reason) to tell the user
+        notice_interval (float): Minimum seconds between throttle notices per user
+        bypass: Optional callable(update) -> bool; updates it accepts run at once,
+            uncharged (e.g. group chatter that no handler will act on)
+    """
+
+    def __init__(self, max_active=16, per_user_active=1, max_queued_per_user=5,
+                 quota_units=120.0, quota_window=600.0, heavy_fraction=0.5,
+                 cost_model=None, on_throttled=None, notice_interval=60.0, max_pending=1024,
+                 bypass=None):
+        # PTB's own semaphore only bounds queued + active updates
+        super().__init__(max_pending)
+        self.max_active = max_active
+        self.per_user_active = per_user_active
+        self.max_queued_per_user = max_queued_per_user
+        self.quota_units = quota_units
+        self.quota_window = quota_window
+        self.heavy_fraction = heavy_fraction
+        self.cost_model = cost_model or CostModel()
+        self.on_throttled = on_throttled
+        self.notice_interval = notice_interval
+        self.bypass = bypass
+        self._users = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._active = 0
+        self._queued = 0
+        SCHED_QUEUED.set_function(lambda: self._queued)
+        SCHED_ACTIVE.set_function(lambda: self._active)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _prune_usage(self, user, now):
+        cutoff = now - self.quota_window
+        while user.usage and user.usage[0][0] < cutoff:
+            user.usage_total -= user.usage.popleft()[1]
+
+    def user_class(self, user):
+        if self.quota_units and user.usage_total >= self.heavy_fraction * self.quota_units:
+            return 'heavy'
+        return 'light'
+
+    async def do_process_update(self, update, coroutine):
+        user_obj = getattr(update, 'effective_user', None)
+        if user_obj is None or (self.bypass is not None and self.bypass(update)):
+            # Channel posts, polls etc. aren't tied to a user, and bypassed
+            # updates are dropped by the handler filters; run them directly
+            await coroutine
+            return
+
+        now = time.monotonic()
+        kind, cost = self.cost_model.estimate(update)
+        user = self._users.get(user_obj.id)
+        if user is None:
+            user = self._users[user_obj.id] = _UserState()
+        self._prune_usage(user, now)
+        user_class = self.user_class(user)
+
+        reason = None
+        if self.quota_units and user.usage and user.usage_total + cost > self.quota_units:
+            reason = 'quota'
+        elif user.queued >= self.max_queued_per_user:
+            reason = 'queue_full'
+        if reason is not None:
+            SCHED_THROTTLED.labels(user_class, reason).inc()
+            coroutine.close()
+            await self._notify(update, user, reason, now)
+            return
+
+        # Charged when queued so a burst can't line up more than the quota
+        charge = (now, cost)
+        user.usage.append(charge)
+        user.usage_total += cost
+
+        # Start-time fair queuing: a user's next update starts after their previous one's cost
+        start = max(self._virtual_time, user.finish)
+        user.finish = start + cost
+        entry = _Entry(start, next(self._seq), user, asyncio.get_running_loop().create_future())
+        user.queued += 1
+        self._queued += 1
+        heapq.heappush(self._heap, entry)
+        self._dispatch()
+        try:
+            await entry.future
+        except BaseException:
+            entry.cancelled = True
+            if not entry.future.done() or entry.future.cancelled():
+                user.queued -= 1
+                self._queued -= 1
+                self._refund(user, charge)
+                coroutine.close()
+                raise
+            # Admitted just as we were cancelled: give the slot back
+            self._release(user)
+            coroutine.close()
+            raise
+
+        SCHED_WAIT.labels(user_class, kind).observe(time.monotonic() - now)
+        SCHED_ADMITTED.labels(user_class, kind).inc()
+        SCHED_COST.labels(user_class).inc(cost)
+        try:
+            await coroutine
+        finally:
+            self._release(user)
+
+    def _refund(self, user, charge):
+        try:
+            user.usage.remove(charge)
+            user.usage_total -= charge[1]
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        """Admit queued updates in start-tag order while there is capacity"""
+        skipped = []
+        while self._heap and self._active < self.max_active:
+            entry = heapq.heappop(self._heap)
+            if entry.cancelled:
+                continue
+            if entry.user.active >= self.per_user_active:
+                # This user is at their cap; later users may still go
+                skipped.append(entry)
+                continue
+            entry.user.queued -= 1
+            entry.user.active += 1
+            self._queued -= 1
+            self._active += 1
+            self._virtual_time = max(self._virtual_time, entry.start)
+            entry.future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+    def _release(self, user):
+        user.active -= 1
+        self._active -= 1
+        self._dispatch()
+        if len(self._users) > 1024 and not self._heap:
+            self._users = {uid: state for uid, state in self._users.items() if not state.idle}
+
+    async def _notify(self, update, user, reason, now):
+        if self.on_throttled is None or now - user.notified_at < self.notice_interval:
+            return
+        user.notified_at = now
+        try:
+            await self.on_throttled(update, reason)
+        except Exception as e:
+            logger.debug(f"Throttle notice failed: {e}")
@@ -0,0 +1,232 @@
+"""
+Local dedupe and ranking of web search results.
+
+Results from several overlapping queries are deduplicated by normalized URL
+and by near-duplicate text (word shingles + MinHash), split into passages,
+ranked against the user message with BM25 and packed into a token budget.
+The packed passages go straight into the main prompt, which replaces the
+separate Gemini summarization call.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_CJK = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]')
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+_TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'ref', 'ref_src'}
+_TRACKING_PREFIXES = ('utm_', 'mc_')
+
+# Salts for the MinHash permutations (fixed so signatures are stable)
+_MINHASH_SEEDS = tuple(range(1, 65))
+_MASK = (1 << 32) - 1
+
+
+def tokenize(text):
+    """Lowercase word tokens; CJK runs become character bigrams"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if _CJK.search(token) and len(token) > 1:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def estimate_tokens(text):
+    # Same rough estimate UserMemory uses for stored messages
+    return len(text.split())
+
+
+def normalize_url(url):
+    """Canonical form of a URL for deduplication"""
+    if not url:
+        return None
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in _TRACKING_PARAMS and not key.lower().startswith(_TRACKING_PREFIXES)
+    ]
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https' if parts.scheme in ('http', 'https') else parts.scheme,
+                       netloc, path, urlencode(sorted(query)), ''))
+
+
+def shingles(tokens, size=3):
+    if len(tokens) < size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash_signature(shingle_set):
+    """MinHash signature over crc32 hashes of the shingles"""
+    if not shingle_set:
+        return None
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    # Cheap universal-hash family: (a * h + seed) mod 2^32, a odd
+    return tuple(
+        min(((2 * seed + 1) * 2654435761 * h + seed) & _MASK for h in hashes)
+        for seed in _MINHASH_SEEDS
+    )
+
+
+def estimated_jaccard(sig_a, sig_b):
+    if sig_a is None or sig_b is None:
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class Passage:
+    __slots__ = ('text', 'title', 'url', 'tokens', 'score')
+
+    def __init__(self, text, title, url):
+        self.text = text
+        self.title = title
+        self.url = url
+        self.tokens = tokenize(text)
+        self.score = 0.0
+
+
+def split_passages(text, max_words=80):
+    """Split text into passages of roughly max_words, on sentence boundaries"""
+    passages = []
+    current = []
+    count = 0
+    for paragraph in text.split('\n'):
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            if not sentence:
+                continue
+            words = len(sentence.split())
+            if current and count + words > max_words:
+                passages.append(' '.join(current))
+                current, count = [], 0
+            current.append(sentence)
+            count += words
+    if current:
+        passages.append(' '.join(current))
+    return passages
+
+
+def dedupe_results(results):
+    """Drop results whose normalized URL was already seen, keeping order"""
+    seen = set()
+    unique = []
+    for result in results:
+        key = normalize_url(result.get('href') or result.get('link')) or result.get('body')
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(result)
+    return unique
+
+
+def dedupe_passages(passages, threshold=0.8):
+    """Drop passages that are near-duplicates of an earlier passage"""
+    kept = []
+    signatures = []
+    for passage in passages:
+        signature = minhash_signature(shingles(passage.tokens))
+        if any(estimated_jaccard(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(passage)
+        signatures.append(signature)
+    return kept
+
+
+def bm25_scores(query_tokens, passages, k1=1.5, b=0.75):
+    """Score passages against the query with Okapi BM25"""
+    if not passages:
+        return []
+    doc_freq = Counter()
+    for passage in passages:
+        doc_freq.update(set(passage.tokens))
+    n = len(passages)
+    avg_len = sum(len(p.tokens) for p in passages) / n or 1.0
+    query_terms = Counter(query_tokens)
+
+    scores = []
+    for passage in passages:
+        term_freq = Counter(passage.tokens)
+        length_norm = k1 * (1 - b + b * len(passage.tokens) / avg_len)
+        score = 0.0
+        for term, query_count in query_terms.items():
+            tf = term_freq.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += query_count * idf * tf * (k1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return scores
+
+
+def rank_search_results(user_message, results, page_texts=None, token_budget=1500,
+                        extra_query="", duplicate_threshold=0.8):
+    """
+    Build a compact, ranked search context for the main prompt
+
+    Args:
+        user_message (str): The user's message, used as the BM25 query
+        results (list): Search result dicts with body/title/href (or link)
+        page_texts (dict): Optional url -> extracted page text
+        token_budget (int): Maximum estimated tokens of packed passages
+        extra_query (str): Extra query text (e.g. generated search queries)
+        duplicate_threshold (float): MinHash Jaccard above which passages are dropped
+
+    Returns:
+        tuple: (context string, stats dict)
+    """
+    page_texts = page_texts or {}
+    unique = dedupe_results(results)
+
+    passages = []
+    for result in unique:
+        url = result.get('href') or result.get('link')
+        title = result.get('title', '')
+        body = result.get('body')
+        if body:
+            passages.append(Passage(body, title, url))
+        for chunk in split_passages(page_texts.get(url, '')):
+            passages.append(Passage(chunk, title, url))
+    candidate_count = len(passages)
+    passages = dedupe_passages(passages, duplicate_threshold)
+
+    query_tokens = tokenize(user_message) + tokenize(extra_query)
+    for passage, score in zip(passages, bm25_scores(query_tokens, passages)):
+        passage.score = score
+    # Stable sort keeps search-engine order between equal scores
+    ranked = sorted(passages, key=lambda p: p.score, reverse=True)
+    if ranked and ranked[0].score > 0:
+        # Passages sharing no term with the query only cost prompt tokens
+        ranked = [p for p in ranked if p.score > 0]
+
+    packed = []
+    used = 0
+    for passage in ranked:
+        cost = estimate_tokens(passage.text)
+        if used + cost > token_budget:
+            continue
+        packed.append(passage)
+        used += cost
+
+    lines = []
+    for i, passage in enumerate(packed, 1):
+        source = f" ({passage.url})" if passage.url else ""
+        lines.append(f"[{i}] {passage.title}{source}\n{passage.text}")
+
+    stats = {
+        'results': len(results),
+        'unique_results': len(unique),
+        'passages': candidate_count,
+        'near_duplicates': candidate_count - len(passages),
+        'packed': len(packed),
+        'tokens': used,
+    }
+    return '\n\n'.join(lines), stats
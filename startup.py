@@ -0,0 +1,123 @@
+"""
+Startup timing for Nyxie.
+
+Records how long the lazy initialization phases take, measures the time
+from process start (approximated by the import of this module, which
+bot.py imports first) to the first handled update, and produces an
+import-time report based on `python -X importtime`.
+"""
+import logging
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+PROCESS_START = time.perf_counter()
+
+# Target for the time between process start and the first handled update
+FIRST_UPDATE_TARGET_S = float(os.getenv("FIRST_UPDATE_TARGET_S", "3.0"))
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    'nyxie_startup_seconds',
+    'Duration of startup phases; first_update is measured from process start',
+    ('phase',)
+)
+
+_phases = {}
+_first_update_seen = False
+
+
+def since_start():
+    return time.perf_counter() - PROCESS_START
+
+
+def record_phase(name, seconds):
+    _phases[name] = seconds
+    STARTUP_SECONDS.labels(name).set(seconds)
+
+
+@contextmanager
+def timed_phase(name):
+    """Time a startup phase and record it"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        record_phase(name, seconds)
+        logger.info(f"Startup phase {name} took {seconds * 1000:.1f} ms")
+
+
+def mark_first_update():
+    """Record time-to-first-update once and warn if it misses the target"""
+    global _first_update_seen
+    if _first_update_seen:
+        return
+    _first_update_seen = True
+    seconds = since_start()
+    record_phase('first_update', seconds)
+    if seconds > FIRST_UPDATE_TARGET_S:
+        logger.warning(f"Time to first update {seconds:.2f}s exceeded target {FIRST_UPDATE_TARGET_S:.2f}s")
+    else:
+        logger.info(f"Time to first update {seconds:.2f}s (target {FIRST_UPDATE_TARGET_S:.2f}s)")
+
+
+def import_time_report(module='bot', top=20):
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Args:
+        module (str): Module to import
+        top (int): Number of slowest imports to return
+
+    Returns:
+        tuple: (total_seconds, list of (cumulative_us, self_us, module_name))
+    """
+    env = dict(os.environ, METRICS_PORT="0")
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # Format: "import time:  <self us> | <cumulative us> | <module>"
+        fields = line[len("import time:"):].split('|', 2)
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        entries.append((cumulative_us, self_us, fields[2].strip()))
+    entries.sort(reverse=True)
+    return total, entries[:top]
+
+
+def print_startup_report(warm_up=None, module='bot', top=20):
+    """Print import times and lazy initialization phases, then return"""
+    total, entries = import_time_report(module, top)
+    print(f"Fresh interpreter + 'import {module}': {total * 1000:.1f} ms")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in entries:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    if warm_up is not None:
+        warm_up()
+    if _phases:
+        print("\nLazy initialization phases:")
+        for name, seconds in _phases.items():
+            print(f"  {name:<20} {seconds * 1000:>9.1f} ms")
+    print(f"\nTime-to-first-update target: {FIRST_UPDATE_TARGET_S:.2f}s (FIRST_UPDATE_TARGET_S)")
@@ -0,0 +1,171 @@
+"""
+Offline location-to-timezone resolution.
+
+Coordinates (a shared Telegram location) are resolved with one shared,
+in-memory TimezoneFinder that is built once, on the warm-up thread, rather
+than per call. Lookups are cached in an LRU keyed by coordinates rounded to
+~1 km, which is well below the size of any timezone.
+
+City names are matched, without any geocoding service, against the city
+part of the IANA zone names (Europe/Istanbul, America/New_York, ...) plus a
+small table of large cities that aren't zone names themselves.
+
+Every name handed out is one the local tzdata can load: zones renamed
+upstream (Europe/Kyiv) fall back to their old name on older tzdata, and
+names that can't be loaded at all are dropped.
+"""
+import logging
+import threading
+import unicodedata
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from metrics import CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Europe/Istanbul'
+
+# Decimal places kept when caching coordinate lookups (0.01° ≈ 1.1 km)
+COORDINATE_PRECISION = 2
+
+# Cities that aren't the city part of an IANA zone name, or match several
+CITY_ALIASES = {
+    'istanbul': 'Europe/Istanbul', 'nicosia': 'Europe/Nicosia',
+    'ankara': 'Europe/Istanbul', 'izmir': 'Europe/Istanbul', 'antalya': 'Europe/Istanbul',
+    'bursa': 'Europe/Istanbul', 'adana': 'Europe/Istanbul', 'konya': 'Europe/Istanbul',
+    'gaziantep': 'Europe/Istanbul', 'eskisehir': 'Europe/Istanbul', 'trabzon': 'Europe/Istanbul',
+    'diyarbakir': 'Europe/Istanbul', 'kayseri': 'Europe/Istanbul', 'samsun': 'Europe/Istanbul',
+    'munich': 'Europe/Berlin', 'munchen': 'Europe/Berlin', 'hamburg': 'Europe/Berlin',
+    'frankfurt': 'Europe/Berlin', 'cologne': 'Europe/Berlin', 'koln': 'Europe/Berlin',
+    'milan': 'Europe/Rome', 'milano': 'Europe/Rome', 'naples': 'Europe/Rome',
+    'barcelona': 'Europe/Madrid', 'valencia': 'Europe/Madrid', 'seville': 'Europe/Madrid',
+    'marseille': 'Europe/Paris', 'lyon': 'Europe/Paris', 'porto': 'Europe/Lisbon',
+    'rotterdam': 'Europe/Amsterdam', 'geneva': 'Europe/Zurich', 'manchester': 'Europe/London',
+    'edinburgh': 'Europe/London', 'saint petersburg': 'Europe/Moscow', 'st petersburg': 'Europe/Moscow',
+    'krakow': 'Europe/Warsaw', 'kharkiv': 'Europe/Kyiv', 'odesa': 'Europe/Kyiv', 'odessa': 'Europe/Kyiv',
+    'washington': 'America/New_York', 'boston': 'America/New_York', 'miami': 'America/New_York',
+    'atlanta': 'America/New_York', 'philadelphia': 'America/New_York',
+    'san francisco': 'America/Los_Angeles', 'seattle': 'America/Los_Angeles',
+    'san diego': 'America/Los_Angeles', 'las vegas': 'America/Los_Angeles',
+    'houston': 'America/Chicago', 'dallas': 'America/Chicago', 'austin': 'America/Chicago',
+    'montreal': 'America/Toronto', 'ottawa': 'America/Toronto', 'rio de janeiro': 'America/Sao_Paulo',
+    'beijing': 'Asia/Shanghai', 'shenzhen': 'Asia/Shanghai', 'guangzhou': 'Asia/Shanghai',
+    'delhi': 'Asia/Kolkata', 'new delhi': 'Asia/Kolkata', 'mumbai': 'Asia/Kolkata',
+    'bangalore': 'Asia/Kolkata', 'bengaluru': 'Asia/Kolkata', 'chennai': 'Asia/Kolkata',
+    'osaka': 'Asia/Tokyo', 'kyoto': 'Asia/Tokyo', 'busan': 'Asia/Seoul', 'abu dhabi': 'Asia/Dubai',
+    'mecca': 'Asia/Riyadh', 'jeddah': 'Asia/Riyadh', 'tel aviv': 'Asia/Jerusalem',
+    'hanoi': 'Asia/Bangkok', 'canberra': 'Australia/Sydney', 'alexandria': 'Africa/Cairo',
+}
+
+_LEGACY_PREFIXES = ('Etc/', 'SystemV/', 'US/', 'Brazil/', 'Canada/', 'Chile/', 'Mexico/')
+
+# Zones renamed in tzdata, and the name older releases ship instead
+_RENAMED_ZONES = {
+    'Europe/Kyiv': 'Europe/Kiev',
+    'Asia/Kolkata': 'Asia/Calcutta',
+    'Asia/Yangon': 'Asia/Rangoon',
+    'Asia/Kathmandu': 'Asia/Katmandu',
+    'Asia/Ho_Chi_Minh': 'Asia/Saigon',
+    'Pacific/Kanton': 'Pacific/Enderbury',
+    'America/Ciudad_Juarez': 'America/Ojinaga',
+}
+
+_finder = None
+_finder_lock = threading.Lock()
+_city_index = None
+
+
+def get_finder():
+    """The shared in-memory TimezoneFinder, built on first use"""
+    global _finder
+    if _finder is None:
+        with _finder_lock:
+            if _finder is None:
+                from timezonefinder import TimezoneFinder
+                _finder = TimezoneFinder(in_memory=True)
+    return _finder
+
+
+def warm_up():
+    """Load the timezone polygons and city index ahead of the first lookup"""
+    get_finder().timezone_at(lng=28.98, lat=41.01)
+    _get_city_index()
+
+
+@lru_cache(maxsize=1024)
+def loadable_timezone(name):
+    """`name`, or its pre-rename alias, if the local tzdata can load it; otherwise None"""
+    for candidate in (name, _RENAMED_ZONES.get(name)):
+        if not candidate:
+            continue
+        try:
+            ZoneInfo(candidate)
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+        return candidate
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _timezone_at_rounded(lat, lng):
+    # Only misses are counted: hits are cheaper than the counter's lock
+    CACHE_MISSES.labels('timezone').inc()
+    # timezonefinder's polygons can be newer than the tzdata ZoneInfo reads
+    name = get_finder().timezone_at(lng=lng, lat=lat)
+    return loadable_timezone(name) if name else None
+
+
+def timezone_at(lat, lng):
+    """IANA timezone for a coordinate, or None (e.g. far out at sea)"""
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return _timezone_at_rounded(round(lat, COORDINATE_PRECISION), round(lng, COORDINATE_PRECISION))
+
+
+def normalize_place(name):
+    """Lowercase, strip accents and separators: 'São_Paulo' -> 'sao paulo', 'İzmir' -> 'izmir'"""
+    name = name.replace('İ', 'i').replace('ı', 'i').casefold()
+    name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    return ' '.join(name.replace('_', ' ').replace('-', ' ').replace('.', ' ').split())
+
+
+def _get_city_index():
+    global _city_index
+    if _city_index is None:
+        index = {}
+        for zone in sorted(available_timezones()):
+            index[normalize_place(zone)] = zone
+            # City part, except for legacy aliases like US/Eastern or Etc/GMT+3
+            if '/' in zone and not zone.startswith(_LEGACY_PREFIXES):
+                index.setdefault(normalize_place(zone.rsplit('/', 1)[1]), zone)
+        for city, zone in CITY_ALIASES.items():
+            zone = loadable_timezone(zone)
+            if zone:
+                index[city] = zone
+            else:
+                index.pop(city, None)
+        _city_index = index
+    return _city_index
+
+
+def resolve_place(text):
+    """
+    Resolve user input to an IANA timezone without network access
+
+    Accepts an IANA name ('Europe/Berlin'), a city ('Berlin', 'New York',
+    'İzmir') or coordinates ('41.01, 28.98').
+
+    Returns:
+        str or None: Timezone name, None if nothing matched
+    """
+    text = text.strip()
+    if not text:
+        return None
+    parts = text.replace(';', ',').split(',')
+    if len(parts) == 2:
+        try:
+            return timezone_at(float(parts[0]), float(parts[1]))
+        except ValueError:
+            pass
+    return _get_city_index().get(normalize_place(text))
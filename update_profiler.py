@@ -0,0 +1,119 @@
+"""
+Opt-in per-update profiling.
+
+A configurable fraction of updates, or the next N updates after an admin
+runs /profile, are run under cProfile and the stats are written to disk as
+`.prof` files for offline analysis (`python -m pstats`, snakeviz, ...).
+
+cProfile hooks the whole thread, so a profile also contains whatever other
+updates ran on the event loop meanwhile, and only one update is profiled at
+a time. That is what makes it useful for finding code that blocks the
+loop. Work sent to worker threads (asyncio.to_thread) is not included.
+"""
+import asyncio
+import cProfile
+import logging
+import random
+import time
+from pathlib import Path
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPDATE_PROFILES = REGISTRY.counter(
+    'nyxie_update_profiles_total',
+    'Per-update profiles by outcome (written, busy, error)',
+    ('kind', 'outcome')
+)
+
+
+class _Session:
+    """Context manager profiling one update; a no-op when not selected"""
+    __slots__ = ('profiler', 'kind', 'update_id', 'profile', 'start')
+
+    def __init__(self, profiler, kind, update_id):
+        self.profiler = profiler
+        self.kind = kind
+        self.update_id = update_id
+        self.profile = None
+
+    def __enter__(self):
+        if self.profiler._select(self.kind):
+            self.profile = cProfile.Profile()
+            self.start = time.perf_counter()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profiler._finish(self)
+        return False
+
+
+class UpdateProfiler:
+    """
+    Samples updates for cProfile
+
+    Args:
+        sample_rate (float): Fraction of updates to profile (0 profiles only on request)
+        output_dir (str): Directory the .prof files are written to
+    """
+
+    def __init__(self, sample_rate=0.0, output_dir="profiles"):
+        self.sample_rate = sample_rate
+        self.output_dir = Path(output_dir)
+        self._armed = 0
+        self._active = False
+
+    def arm(self, count):
+        """Profile the next `count` updates regardless of the sample rate"""
+        self._armed = max(0, count)
+
+    @property
+    def armed(self):
+        return self._armed
+
+    def profile(self, update, kind):
+        """
+        Profile the wrapped update if it is selected
+
+        Args:
+            update (telegram.Update): Update being handled, used to name the file
+            kind (str): Update kind, e.g. 'text', 'image', 'video'
+        """
+        return _Session(self, kind, getattr(update, 'update_id', 0))
+
+    def _select(self, kind):
+        if not self._armed and not (self.sample_rate and random.random() < self.sample_rate):
+            return False
+        if self._active:
+            UPDATE_PROFILES.labels(kind, 'busy').inc()
+            return False
+        if self._armed:
+            self._armed -= 1
+        self._active = True
+        return True
+
+    def _finish(self, session):
+        self._active = False
+        elapsed_ms = (time.perf_counter() - session.start) * 1000
+        path = self.output_dir / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{session.kind}_{session.update_id}_{elapsed_ms:.0f}ms.prof"
+        )
+        try:
+            # Writing the stats is file I/O, keep it off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._dump, session.profile, path, session.kind)
+        except RuntimeError:
+            self._dump(session.profile, path, session.kind)
+
+    def _dump(self, profile, path, kind):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profile.dump_stats(str(path))
+            UPDATE_PROFILES.labels(kind, 'written').inc()
+            logger.info(f"Wrote update profile {path}")
+        except Exception as e:
+            UPDATE_PROFILES.labels(kind, 'error').inc()
+            logger.error(f"Could not write update profile {path}: {e}")